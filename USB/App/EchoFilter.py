@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2015 Pierre Vacher <prrvchr@gmail.com>                  *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+""" Terminal Echo filter object """
+from __future__ import unicode_literals
+
+import FreeCAD, json, re, threading
+
+
+""" Nested object and top level key of a relaxed JSON command: {xvm:n}, {"x":{"vm":n}} """
+NESTED = re.compile(r"\{[^{}]*\}")
+KEY = re.compile(r'(?:^|,)\s*"?([A-Za-z0-9]+)"?\s*:')
+
+
+def getKeys(command):
+    """ Top level keys of a JSON command, lower case as in responses, empty if not JSON """
+    command = command.strip()
+    if not (command.startswith("{") and command.endswith("}")):
+        return set()
+    inner = command[1:-1]
+    while NESTED.search(inner):
+        inner = NESTED.sub("0", inner)
+    return set(k.lower() for k in KEY.findall(inner))
+
+
+class EchoFilter:
+
+    def __init__(self, keys=(), patterns=()):
+        """ JSON lines made only of these keys, text lines matching a pattern are filtered """
+        self.setKeys(keys)
+        self.setPatterns(patterns)
+        self.enabled = False
+        """ Job in progress, set by the machine decoder """
+        self.busy = False
+        """ Keys of the JSON commands typed in terminal during the job, responses always shown """
+        self.expected = []
+        self.lock = threading.Lock()
+
+    def setKeys(self, keys):
+        self.keys = set(k.strip().strip('"') for k in keys if k.strip())
+
+    def setPatterns(self, patterns):
+        """ Invalid patterns are reported and ignored """
+        compiled = []
+        for p in patterns:
+            try:
+                compiled.append(re.compile(p))
+            except re.error as e:
+                self.patternErrorMsg(p, e)
+        self.patterns = compiled
+
+    def setBusy(self, busy):
+        """ Called in reader thread, commands not answered are forgotten at job end """
+        self.busy = busy
+        if not busy:
+            with self.lock:
+                self.expected = []
+
+    def expect(self, command):
+        """ Called from GUI thread for a typed command: only JSON responses are filtered """
+        if not (self.enabled and self.busy):
+            return
+        keys = getKeys(command)
+        if keys:
+            with self.lock:
+                self.expected.append(keys)
+
+    def consume(self, r):
+        """ Return True if response r answers a typed command, matched by key """
+        if type(r) is not dict:
+            return False
+        keys = set(r)
+        with self.lock:
+            for i, expected in enumerate(self.expected):
+                if keys & expected:
+                    del self.expected[i]
+                    return True
+        return False
+
+    def accept(self, line):
+        """ Called in reader thread: return True if line goes to terminal """
+        if not (self.enabled and self.busy):
+            return True
+        try:
+            d = json.loads(line)
+        except ValueError:
+            d = None
+        if type(d) is dict:
+            if self.isError(d):
+                return True
+            if d.has_key("r") and self.consume(d["r"]):
+                return True
+            keys = set(d) - set(["f"])
+            return not keys or not keys <= self.keys
+        if "error" in line.lower():
+            return True
+        return not any(p.search(line) for p in self.patterns)
+
+    def isError(self, d):
+        footer = d.get("f")
+        if footer is None and type(d.get("r")) is dict:
+            footer = d["r"].get("f")
+        if type(footer) is list and len(footer) > 1 and footer[1] != 0:
+            return True
+        return d.has_key("er")
+
+    def patternErrorMsg(self, pattern, e):
+        msg = "Error occurred in echo filter pattern {}: {}\n"
+        FreeCAD.Console.PrintError(msg.format(pattern, e))
+
+
+FreeCAD.Console.PrintLog("Loading EchoFilter... done\n")
@@ -25,8 +25,8 @@
 from __future__ import unicode_literals
 
 import FreeCAD, serial
-from serial.tools import list_ports
-from App import PySerialState
+from serial.tools import list_ports_registry
+from App import PySerialState, PySerialStats, SessionLog
 
 
 class PySerial:
@@ -36,6 +36,7 @@ class PySerial:
         """ Internal property for management of data update """
         self.Update = []
         self.Type = "App::PySerial"
+        self.Stats = PySerialStats.SerialStats()
         """ PySerial Base driving property """
         obj.addProperty("App::PropertyEnumeration",
                         "State",
@@ -113,6 +114,10 @@ class PySerial:
                         "PySerial List_ports Tool",
                         "Discovered ports (perhaps need refresh?)")
         obj.Ports = self.getPorts(obj)
+        """ PySerial traffic statistics """
+        self.initStats(obj)
+        """ PySerial session log """
+        self.initLog(obj)
         obj.Proxy = self
 
     def __getstate__(self):
@@ -122,12 +127,78 @@ class PySerial:
         self.Serial = serial.serial_for_url(None, do_not_open=True)
         self.Update = []
         self.Type = "App::PySerial"
+        self.Stats = PySerialStats.SerialStats()
         return None
 
     def initSerial(self, obj):
         p, s = self.getSettings(obj)
         self.Serial = serial.serial_for_url(p, do_not_open=True, **s)
 
+    def initStats(self, obj):
+        for p, doc in self.Stats.getCounters():
+            # Byte counts as Float: a long session overflows an Integer
+            typ = "App::PropertyFloat" if p.endswith("Bytes") else "App::PropertyInteger"
+            if p in obj.PropertiesList and obj.getTypeIdOfProperty(p) != typ:
+                obj.removeProperty(p)
+            if p not in obj.PropertiesList:
+                obj.addProperty(typ, p, "Statistics", doc, 1)
+        if "Latency" not in obj.PropertiesList:
+            obj.addProperty("App::PropertyStringList",
+                            "Latency",
+                            "Statistics",
+                            "Command to response latency histogram", 1)
+
+    def initLog(self, obj):
+        if "Log" not in obj.PropertiesList:
+            obj.addProperty("App::PropertyBool",
+                            "Log",
+                            "Session log",
+                            "Record all traffic in rotating session log files")
+            obj.Log = False
+        if "LogSize" not in obj.PropertiesList:
+            obj.addProperty("App::PropertyInteger",
+                            "LogSize",
+                            "Session log",
+                            "Log file size (MB) before rotation")
+            obj.LogSize = 10
+        if "LogFiles" not in obj.PropertiesList:
+            obj.addProperty("App::PropertyInteger",
+                            "LogFiles",
+                            "Session log",
+                            "Number of rotated log files kept")
+            obj.LogFiles = 5
+        if "LogCompress" not in obj.PropertiesList:
+            obj.addProperty("App::PropertyBool",
+                            "LogCompress",
+                            "Session log",
+                            "Gzip compress rotated log files")
+            obj.LogCompress = True
+
+    def getLogChannel(self, obj):
+        return "{}-{}".format(obj.Document.Name, obj.Name)
+
+    def openLog(self, obj):
+        """ Return the log channel of obj, None if not logged """
+        self.initLog(obj)
+        if not obj.Log:
+            return None
+        channel = self.getLogChannel(obj)
+        SessionLog.Logger.open(channel, max(1, obj.LogSize) * 1024 * 1024,
+                               max(0, obj.LogFiles), obj.LogCompress)
+        return channel
+
+    def updateStats(self, obj):
+        """ Copy the counters to the Statistics properties (on close, error, recompute) """
+        self.initStats(obj)
+        for p, doc in self.Stats.getCounters():
+            value = getattr(self.Stats, p)
+            if getattr(obj, p) != value:
+                setattr(obj, p, value)
+        latency = self.Stats.getLatency()
+        if obj.Latency != latency:
+            obj.Latency = latency
+        obj.purgeTouched()
+
     def getState(self):
         return [b"Close", b"Init", b"Open", b"Start", b"Run", b"Error"]
 
@@ -138,12 +209,13 @@ class PySerial:
         return self.getDetails().index(obj.Details)
 
     def getPorts(self, obj):
-        return [x[self.getDetailsIndex(obj)] for x in list_ports.comports()]
+        i = self.getDetailsIndex(obj)
+        return [x[i] for x in list_ports_registry.comports()]
 
     def getPortsIndex(self, obj):
         # Get unique index of the port
         try:
-            p = list_ports.grep("^{}$".format(obj.Ports))
+            p = list_ports_registry.grep("^{}$".format(obj.Ports))
             i = self.getPorts(obj).index(p.next()[self.getDetailsIndex(obj)])
         except (AssertionError, StopIteration, ValueError):
             return -1
@@ -159,12 +231,18 @@ class PySerial:
         if index != -1:
             obj.Ports = index
 
+    def updatePorts(self, obj):
+        self.Update = ["Port"]
+        self.refreshPorts(obj)
+        self.Update = []
+
     def refreshBaudrate(self, obj):
         baudrate = obj.Baudrate
         obj.Baudrate = map(str, serial.Serial().BAUDRATES)
         obj.Baudrate = baudrate
 
     def execute(self, obj):
+        self.updateStats(obj)
         if self.Update:
             if "Port" in self.Update:
                 self.refreshPorts(obj)
@@ -174,9 +252,7 @@ class PySerial:
 
     def onChanged(self, obj, prop):
         if prop == "Details":
-            self.Update = ["Port"]
-            self.refreshPorts(obj)
-            self.Update = []
+            self.updatePorts(obj)
         if prop == "Ports":
             if not self.Update and self.getPortsIndex(obj) != -1:
                 if self.getDetailsIndex(obj) == 0:
@@ -288,6 +364,13 @@ class PySerial:
     def isUrl(self, obj):
         return "://" in obj.Port
 
+    def getUsbId(self, obj):
+        # USB identity (VID, PID, serial, interface) of the opened device
+        info = list_ports_registry.find(self.Serial.port)
+        if info is None:
+            return None
+        return list_ports_registry.usb_id(info)
+
     def getPort(self, obj):
         return b"{}".format(obj.Port)
     def getBaudrate(self, obj):
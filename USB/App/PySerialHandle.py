@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2015 Pierre Vacher <prrvchr@gmail.com>                  *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+""" PySerial open port handle manager object """
+from __future__ import unicode_literals
+
+import FreeCAD, threading
+
+
+class Handle:
+
+    def __init__(self, serial, sio, plugin, timer):
+        self.serial = serial
+        self.sio = sio
+        self.plugin = plugin
+        self.timer = timer
+
+
+class HandleManager:
+
+    def __init__(self):
+        self.handles = {}
+        self.lock = threading.Lock()
+        """ Time (s) before an unclaimed handle is closed """
+        self.timeout = 10.0
+
+    def getKey(self, port, settings):
+        return (port, tuple(sorted(settings.items())))
+
+    def park(self, key, serial, sio, plugin):
+        """ Keep an open port alive until it is claimed by take() """
+        timer = threading.Timer(self.timeout, self.expire, [key])
+        timer.daemon = True
+        with self.lock:
+            old = self.handles.pop(key, None)
+            self.handles[key] = Handle(serial, sio, plugin, timer)
+        if old is not None:
+            self.close(old)
+        timer.start()
+        self.parkMsg(serial)
+
+    def take(self, key):
+        with self.lock:
+            handle = self.handles.pop(key, None)
+        if handle is None:
+            return None
+        handle.timer.cancel()
+        if not handle.serial.is_open:
+            return None
+        return handle
+
+    def expire(self, key):
+        with self.lock:
+            handle = self.handles.pop(key, None)
+        if handle is not None:
+            self.close(handle)
+
+    def close(self, handle):
+        handle.timer.cancel()
+        if handle.serial.is_open:
+            handle.serial.close()
+            self.closeMsg(handle.serial)
+
+    def parkMsg(self, serial):
+        msg = "Keeping port {} open for restart... done\n"
+        FreeCAD.Console.PrintLog(msg.format(serial.name))
+
+    def closeMsg(self, serial):
+        msg = "Unclaimed port {} closing... done\n"
+        FreeCAD.Console.PrintLog(msg.format(serial.name))
+
+
+Handles = HandleManager()
+
+
+FreeCAD.Console.PrintLog("Loading PySerialHandle... done\n")
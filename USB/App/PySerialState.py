@@ -24,8 +24,9 @@
 """ PySerial StateMachine document object """
 from __future__ import unicode_literals
 
-import FreeCAD, serial, io, json
+import FreeCAD, serial, io, os, time, select, errno, threading
 from PySide import QtCore
+from App import UsbProbe, PySerialHandle, SessionLog, SessionIndex
 
 
 class SerialState(QtCore.QState):
@@ -41,6 +42,17 @@ class SerialState(QtCore.QState):
         self.setObjectName("Serial")
         self.obj = None
         self.sio = None
+        self.device = None
+        self.lost = False
+        self.plugin = None
+        self.wakeup = None
+        """ Session log channel, None if not logged """
+        self.log = None
+        """ Searchable index of the lines received, only while a terminal is open """
+        self.index = None
+        """ Lines emitted to the terminal, counted with the emit under lock """
+        self.shown = 0
+        self.lock = threading.Lock()
 
         Init = InitState(self)
         Init.setObjectName(b"Init")
@@ -71,8 +83,15 @@ class SerialState(QtCore.QState):
     def getParent(self):
         return self.obj.Proxy.getParent(self.obj)
 
+    def getHandleKey(self):
+        port, settings = self.obj.Proxy.getSettings(self.obj)
+        return PySerialHandle.Handles.getKey(port, settings)
+
     def trySerialOpen(self):
-        if not self.obj.Proxy.Serial.is_open:
+        handle = PySerialHandle.Handles.take(self.getHandleKey())
+        if handle is not None:
+            self.doSerialReuse(handle)
+        elif not self.obj.Proxy.Serial.is_open:
             port, settings = self.obj.Proxy.getSettings(self.obj)
             try:
                 self.obj.Proxy.Serial = serial.serial_for_url(port, **settings)
@@ -87,16 +106,71 @@ class SerialState(QtCore.QState):
         eol = self.machine().getCharEndOfLine()
         s = io.BufferedRWPair(self.obj.Proxy.Serial, self.obj.Proxy.Serial)
         self.sio = io.TextIOWrapper(s, newline=eol)
+        self.obj.Proxy.Stats.reset()
+        self.device = self.obj.Proxy.getUsbId(self.obj)
+        self.lost = False
+        self.log = self.obj.Proxy.openLog(self.obj)
         self.serialOpenMsg()
 
+    def doSerialReuse(self, handle):
+        # Port kept open across restart: no reset and no new handshake
+        self.obj.Proxy.Serial = handle.serial
+        self.sio = handle.sio
+        self.plugin = handle.plugin
+        self.device = self.obj.Proxy.getUsbId(self.obj)
+        self.lost = False
+        self.log = self.obj.Proxy.openLog(self.obj)
+        self.serialReuseMsg()
+
+    def doSerialPark(self):
+        if self.isOpen():
+            PySerialHandle.Handles.park(self.getHandleKey(), self.obj.Proxy.Serial,
+                                        self.sio, self.plugin)
+        self.sio = None
+        self.closeLog()
+        self.closeIndex()
+
     def isOpen(self):
         return self.obj.Proxy.Serial.is_open
 
+    def isPosix(self):
+        # Only POSIX ports can be waited on together with the wakeup pipe
+        return os.name == "posix" and isinstance(self.obj.Proxy.Serial, serial.Serial)
+
+    def wakeUp(self):
+        wakeup = self.wakeup
+        if wakeup is not None:
+            wakeup.set()
+
     def doSerialClose(self):
         if self.isOpen():
             self.serialCloseMsg()
             self.obj.Proxy.Serial.close()
         self.sio = None
+        self.closeLog()
+        self.closeIndex()
+
+    def closeLog(self):
+        if self.log is not None:
+            SessionLog.Logger.close(self.log)
+        self.log = None
+
+    def openIndex(self, limit):
+        """ Called from GUI thread by the terminal, limit is about its scrollback """
+        self.closeIndex()
+        self.index = SessionIndex.SessionIndex(limit)
+        SessionIndex.Indexer.add(self.index)
+
+    def closeIndex(self):
+        if self.index is not None:
+            SessionIndex.Indexer.remove(self.index)
+        self.index = None
+
+    def logData(self, direction, data):
+        """ Called from serial threads: queued, never blocks """
+        log = self.log
+        if log is not None and not SessionLog.Logger.log(log, direction, data):
+            self.obj.Proxy.Stats.onLogDrop()
 
     def doThreadClose(self):
         self.stopThreadMsg()
@@ -112,30 +186,27 @@ class SerialState(QtCore.QState):
         return self.sio.readline()
 
     def getPlugin(self):
-        plugin, extra = b"UsbPool", {}
-        try:
-            s = json.loads(self.getSignature())
-        except ValueError:
-            pass
-            #device = __import__("App").UsbPool
-        else:
-            if s.has_key("r"):
-                r = s["r"]
-                if (r.has_key("fv") and r["fv"] >= 0.98 and
-                    r.has_key("hp") and r["hp"] >= 3 and
-                    r.has_key("hv") and r["hv"] >= 0 and
-                    r.has_key("fb") and r["fb"] >= 83.09 and
-                    r.has_key("msg") and r.has_key("id")):
-                    plugin = b"TinyG2"
-                    #device = __import__("App").TinyG2
-                    extra = {"msg": r["msg"], "id": r["id"]}
+        # Port reused from restart: plugin already known
+        if self.plugin is not None:
+            return self.plugin
+        # Known device: no need to reopen port for signature
+        plugin = UsbProbe.Probe.cache.get(self.device)
+        if plugin is not None:
+            return plugin
+        signature = self.getSignature()
+        plugin, extra = UsbProbe.getPlugin(signature)
+        # Nothing to remember from a timeout or a partial line
+        if signature.endswith(self.machine().getCharEndOfLine()):
+            UsbProbe.Probe.cache.set(self.device, plugin, extra)
         return plugin, extra
 
     def newPlugin(self):
         if self.isCtrlChannel():
             plugin, extra = self.getPlugin()
+            self.plugin = None
             o = self.getParent()
             if plugin != o.Proxy.Plugin:
+                self.plugin = plugin, extra
                 self.machine().plugin = plugin
                 self.newDeviceMsg(plugin)
                 return True
@@ -151,6 +222,10 @@ class SerialState(QtCore.QState):
         msg = "{} opening port {}... done\n"
         FreeCAD.Console.PrintLog(msg.format(self.obj.Label, self.obj.Proxy.Serial.name))
 
+    def serialReuseMsg(self):
+        msg = "{} reusing port {} kept open... done\n"
+        FreeCAD.Console.PrintLog(msg.format(self.obj.Label, self.obj.Proxy.Serial.name))
+
     def serialCloseMsg(self):
         msg = "{} closing port {}... done\n"
         FreeCAD.Console.PrintLog(msg.format(self.obj.Label, self.obj.Proxy.Serial.name))
@@ -190,9 +265,10 @@ class InitState(QtCore.QState):
         self.parentState().obj.State = b"{}".format(self.objectName())
         if self.parentState().trySerialOpen():
             if self.parentState().newPlugin():
-                self.parentState().doSerialClose()
-                self.machine().startThread(RestartMachine(self.machine()))
-                self.machine().run = False                
+                self.parentState().doSerialPark()
+                self.machine().restarting = True
+                self.machine().run = False
+                self.machine().wakeUp()
                 self.parentState().serialClose.emit()
             else:
                 self.parentState().serialOpen.emit()
@@ -214,6 +290,7 @@ class CloseState(QtCore.QFinalState):
         # and obj already deleted
         try:
             self.parentState().obj.State = b"{}".format(self.objectName())
+            self.parentState().obj.Proxy.updateStats(self.parentState().obj)
             self.parentState().obj.purgeTouched()
         except ReferenceError:
             pass
@@ -222,17 +299,30 @@ class ErrorState(QtCore.QFinalState):
     
     def onEntry(self, e):
         self.parentState().obj.State = b"{}".format(self.objectName())
+        self.parentState().obj.Proxy.updateStats(self.parentState().obj)
         self.machine().run = False
+        self.machine().wakeUp()
 
 
 class SerialWriter(QtCore.QSignalTransition):
 
     def onTransition(self, e):
+        state = self.sourceState().parentState()
+        data = e.arguments()[0] + self.machine().getCharEndOfLine()
         try:
-            state = self.sourceState().parentState()
-            state.sio.write(e.arguments()[0] + self.machine().getCharEndOfLine())
+            start = time.time()
+            state.sio.write(data)
             state.sio.flush()
+            state.obj.Proxy.Stats.onWrite(data, time.time() - start)
+            state.logData("TX", data)
+        except serial.SerialTimeoutException as e:
+            state.obj.Proxy.Stats.onWrite(data, None)
+            # Failed writes matter most in a post-mortem
+            state.logData("TX!", data)
+            state.writerErrorMsg(e)
+            state.serialError.emit()
         except Exception as e:
+            state.logData("TX!", data)
             state.writerErrorMsg(e)
             state.serialError.emit()
 
@@ -250,32 +340,104 @@ class SerialReader(QtCore.QRunnable):
             if isCtrl:
                 self.state.machine().ctrlStart.emit()
             self.state.startThreadMsg()
-            while self.state.machine().run:
-                line = self.state.sio.readline()
-                if len(line):
-                    self.state.serialRead.emit(line)
-                    if isCtrl:
-                        self.state.machine().serialRead.emit(line)
+            if self.state.isPosix():
+                self.waitLines(isCtrl)
+            else:
+                self.readLines(isCtrl)
             self.state.doThreadClose()
             if isCtrl:
                 self.state.machine().ctrlStop.emit()
             self.state.serialClose.emit()
         except Exception as e:
             self.state.errorThreadMsg(e)
+            # USB device lost: HotplugMonitor will reconnect when it comes back
+            self.state.lost = self.state.device is not None
             self.state.serialError.emit()
 
-
-class RestartMachine(QtCore.QRunnable):
-
-    def __init__(self, machine):
-        QtCore.QRunnable.__init__(self)
-        self.machine = machine
-
-    def run(self):
-        """ Wait for restart StateMachine """
+    def onLine(self, line, isCtrl):
+        stats = self.state.obj.Proxy.Stats
+        stats.onRead(line)
+        if len(line):
+            self.state.logData("RX", line)
+            machine = self.state.machine()
+            if isCtrl:
+                machine.serialRead.emit(line)
+                # Decoded here to keep the GUI thread free
+                updates = machine.decode(line)
+                if updates:
+                    machine.serialData.emit(updates)
+            # Filtered after decoding: a report may start or end the job
+            if machine.filter is None or machine.filter.accept(line):
+                with self.state.lock:
+                    shown = self.state.shown
+                    self.state.shown += 1
+                    self.state.serialRead.emit(line)
+            else:
+                shown = -1
+                stats.onFilter()
+            index = self.state.index
+            if index is not None:
+                index.push(line, shown)
+
+    def readLines(self, isCtrl):
+        """ Stop is seen when readline timeout """
+        while self.state.machine().run:
+            self.onLine(self.state.sio.readline(), isCtrl)
+
+    def waitLines(self, isCtrl):
+        """ Block on port and wakeup pipe: no timeout needed to stop """
+        port = self.state.obj.Proxy.Serial
+        eol = self.state.machine().getCharEndOfLine()
+        # Readline must return what is available, partial line are joined here
+        timeout = port.timeout
+        port.timeout = 0
+        wakeup = WakeUp()
+        self.state.wakeup = wakeup
+        line = ""
         try:
-            while self.machine.isRunning():
-                pass
-            self.machine.restart.emit(self.machine.obj)
-        except Exception as e:
-            self.machine.machineErrorMsg(e)
\ No newline at end of file
+            while self.state.machine().run:
+                try:
+                    ready, _, _ = select.select([port.fileno(), wakeup], [], [])
+                except select.error as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+                if wakeup in ready:
+                    wakeup.clear()
+                    continue
+                data = self.state.sio.readline()
+                while data:
+                    line += data
+                    if line.endswith(eol):
+                        self.onLine(line, isCtrl)
+                        line = ""
+                    data = self.state.sio.readline()
+        finally:
+            self.state.wakeup = None
+            wakeup.close()
+            # Configured timeout is kept by a parked handle and later reads
+            port.timeout = timeout
+
+
+class WakeUp:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fds = os.pipe()
+
+    def fileno(self):
+        return self.fds[0]
+
+    def set(self):
+        with self.lock:
+            if self.fds is not None:
+                os.write(self.fds[1], b"x")
+
+    def clear(self):
+        os.read(self.fds[0], 512)
+
+    def close(self):
+        with self.lock:
+            os.close(self.fds[0])
+            os.close(self.fds[1])
+            self.fds = None
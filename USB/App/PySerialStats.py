@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2015 Pierre Vacher <prrvchr@gmail.com>                  *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+""" PySerial traffic statistics object """
+from __future__ import unicode_literals
+
+import math, time
+
+
+# Latency histogram: bucket 0 < 1ms, bucket i in [2^(i-1), 2^i) ms
+LATENCY_BUCKETS = 16
+
+
+class SerialStats:
+
+    def __init__(self):
+        """ Write taking longer (s) is counted as a stall """
+        self.stall = 0.05
+        self.reset()
+
+    def reset(self):
+        self.RxBytes = 0
+        self.RxLines = 0
+        self.TxBytes = 0
+        self.TxLines = 0
+        self.Reads = 0
+        self.EmptyReads = 0
+        self.WriteStalls = 0
+        self.Filtered = 0
+        self.LogDropped = 0
+        self.latency = [0] * LATENCY_BUCKETS
+        self.sent = None
+
+    def getCounters(self):
+        return [("RxBytes", "Bytes received"),
+                ("RxLines", "Lines received"),
+                ("TxBytes", "Bytes sent"),
+                ("TxLines", "Lines sent"),
+                ("Reads", "Read calls"),
+                ("EmptyReads", "Read calls returning nothing (timeout)"),
+                ("WriteStalls", "Writes blocked longer than stall time or timed out"),
+                ("Filtered", "Lines received not shown in terminal (echo filter)"),
+                ("LogDropped", "Records dropped by the overloaded session log")]
+
+    def onRead(self, line):
+        # Called from reader thread for each readline()
+        self.Reads += 1
+        if not line:
+            self.EmptyReads += 1
+            return
+        self.RxLines += 1
+        self.RxBytes += len(line)
+        if self.sent is not None:
+            self.addLatency(time.time() - self.sent)
+            self.sent = None
+
+    def onFilter(self):
+        self.Filtered += 1
+
+    def onLogDrop(self):
+        self.LogDropped += 1
+
+    def onWrite(self, data, elapsed):
+        self.TxLines += 1
+        self.TxBytes += len(data)
+        if elapsed is None or elapsed > self.stall:
+            self.WriteStalls += 1
+        if self.sent is None:
+            self.sent = time.time()
+
+    def addLatency(self, delay):
+        i = math.frexp(delay * 1000)[1]
+        self.latency[max(0, min(i, LATENCY_BUCKETS - 1))] += 1
+
+    def getBucketName(self, i):
+        if i == 0:
+            return "<1ms"
+        if i == LATENCY_BUCKETS - 1:
+            return ">{}ms".format(2 ** (i - 1))
+        return "{}-{}ms".format(2 ** (i - 1), 2 ** i)
+
+    def getLatency(self):
+        return ["{}: {}".format(self.getBucketName(i), n)
+                for i, n in enumerate(self.latency) if n]
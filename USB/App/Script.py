@@ -24,6 +24,10 @@
 """ App Resources initialization """
 from __future__ import unicode_literals
 
+import FreeCAD, os
+
+# Cache directory relative to the FreeCAD user data directory
+CACHE_PATH = "USB"
 
 def getObjectType(obj):
     if not obj or obj.TypeId != "App::FeaturePython" and\
@@ -33,3 +37,9 @@ def getObjectType(obj):
         if hasattr(obj.Proxy, "Type"):
             return obj.Proxy.Type
     return None
+
+def getCachePath(name):
+    path = os.path.join(FreeCAD.getUserAppDataDir(), CACHE_PATH)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return os.path.join(path, name)
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2015 Pierre Vacher <prrvchr@gmail.com>                  *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+""" Session index object """
+from __future__ import unicode_literals
+
+import FreeCAD, os, re, bisect, gzip, mmap, threading, collections
+from array import array
+from PySide import QtCore
+
+
+""" Lines per sealed block of text, also the granularity of the limit """
+BLOCK = 4096
+""" Indexed tokens: JSON keys and G/M codes """
+TOKENS = re.compile(r'"([A-Za-z0-9]+)"\s*:|\b([GgMm])0*(\d+(?:\.\d+)?)\b')
+CODE = re.compile(r"^([GgMm])0*(\d+(?:\.\d+)?)$")
+KEY = re.compile(r"^[A-Za-z0-9]+$")
+
+
+def getTokens(line):
+    tokens = set()
+    for key, code, number in TOKENS.findall(line):
+        tokens.add(key.lower() if key else code.upper() + number)
+    return tokens
+
+def getToken(query):
+    """ Token of a key or G/M code query: er, "er", G01 -> er, er, G1 """
+    query = query.strip().strip('"')
+    match = CODE.match(query)
+    if match:
+        return match.group(1).upper() + match.group(2)
+    if KEY.match(query):
+        return query.lower()
+    return None
+
+def getPattern(query):
+    """ Queries run over blocks of lines: ^ and $ anchor on each line """
+    return re.compile(query.encode("utf-8"), re.MULTILINE)
+
+def getLogFiles(path):
+    """ Session log file then rotated files, newest first """
+    files = [path]
+    i = 1
+    while True:
+        for name in ("{}.{}".format(path, i), "{}.{}.gz".format(path, i)):
+            if os.path.isfile(name):
+                files.append(name)
+                break
+        else:
+            return files
+        i += 1
+
+def findInLog(path, line, skip=0):
+    """ File and line number of the RX record of line, skip later records of the same line.
+    Approximate: records dropped by the logger or not yet indexed shift the count """
+    data = line.encode("unicode_escape").decode("ascii").encode("ascii")
+    pattern = re.compile(b" RX " + re.escape(data) + br"(?:\\r)?(?:\\n)?$", re.MULTILINE)
+    for name in getLogFiles(path):
+        try:
+            if name.endswith(".gz"):
+                with gzip.open(name, "rb") as f:
+                    text = f.read()
+            else:
+                with open(name, "rb") as f:
+                    text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            continue
+        try:
+            starts = [m.start() for m in pattern.finditer(text)]
+            if skip < len(starts):
+                return name, text[:starts[-1 - skip]].count(b"\n") + 1
+            skip -= len(starts)
+        finally:
+            if isinstance(text, mmap.mmap):
+                text.close()
+    return None
+
+
+class SessionIndex:
+
+    def __init__(self, limit=10000):
+        """ Lines received, pushed by the reader thread and indexed by the Indexer """
+        self.queue = collections.deque()
+        self.lock = threading.Lock()
+        """ Sealed blocks: first line number, UTF-8 text, line offsets in text """
+        self.blocks = []
+        self.firsts = []
+        self.current = []
+        self.first = 0
+        self.count = 0
+        """ First line kept, oldest blocks dropped above limit lines """
+        self.base = 0
+        self.limit = limit
+        """ Inverted index: token -> line numbers """
+        self.tokens = {}
+        """ Terminal line number of each line kept, -1 if filtered """
+        self.shown = array(b"l")
+
+    def push(self, line, shown=-1):
+        self.queue.append((line, shown))
+
+    def update(self):
+        """ Called in Indexer thread, True if lines were indexed """
+        queue = self.queue
+        if not queue:
+            return False
+        while queue:
+            line, shown = queue.popleft()
+            line = line.rstrip("\r\n")
+            with self.lock:
+                n = self.count
+                for token in getTokens(line):
+                    self.tokens.setdefault(token, array(b"l")).append(n)
+                self.current.append(line.encode("utf-8"))
+                self.shown.append(shown)
+                self.count += 1
+                if len(self.current) == BLOCK:
+                    self.seal()
+        return True
+
+    def seal(self):
+        offsets = array(b"l", [0])
+        for line in self.current:
+            offsets.append(offsets[-1] + len(line) + 1)
+        self.blocks.append((self.first, b"\n".join(self.current), offsets))
+        self.firsts.append(self.first)
+        self.first += len(self.current)
+        self.current = []
+        # Oldest block dropped while the others still hold limit lines
+        while self.blocks and self.count - (self.firsts[1:] or [self.first])[0] >= self.limit:
+            del self.blocks[0]
+            del self.firsts[0]
+        base = self.firsts[0] if self.firsts else self.first
+        if base > self.base:
+            del self.shown[:base - self.base]
+            for token, lines in list(self.tokens.items()):
+                i = bisect.bisect_left(lines, base)
+                if i == len(lines):
+                    del self.tokens[token]
+                elif i:
+                    del lines[:i]
+            self.base = base
+
+    def getLine(self, n):
+        """ Line n, None if dropped """
+        with self.lock:
+            if n < self.base:
+                return None
+            if n >= self.first:
+                return self.current[n - self.first].decode("utf-8")
+            i = bisect.bisect_right(self.firsts, n) - 1
+            first, text, offsets = self.blocks[i]
+            return text[offsets[n - first]:offsets[n - first + 1] - 1].decode("utf-8")
+
+    def getShown(self, n):
+        """ Terminal line number of line n, -1 if filtered or dropped """
+        with self.lock:
+            return self.shown[n - self.base] if self.base <= n < self.count else -1
+
+    def getBlocks(self):
+        """ Blocks from oldest to newest, the current one joined """
+        with self.lock:
+            blocks = list(self.blocks)
+            if self.current:
+                offsets = array(b"l", [0])
+                for line in self.current:
+                    offsets.append(offsets[-1] + len(line) + 1)
+                blocks.append((self.first, b"\n".join(self.current), offsets))
+        return blocks
+
+    def getRepeats(self, n):
+        """ Count of lines after n identical to line n """
+        line = self.getLine(n)
+        if line is None:
+            return 0
+        pattern = getPattern("^{}$".format(re.escape(line)))
+        count = 0
+        for first, text, offsets in self.getBlocks():
+            last = first + len(offsets) - 1
+            if last > n + 1:
+                start = offsets[max(0, n + 1 - first)]
+                count += sum(1 for m in pattern.finditer(text, start))
+        return count
+
+    def getPostings(self, query):
+        """ Line numbers of a key or code query, None for a regex query """
+        token = getToken(query)
+        if token is None or token not in self.tokens:
+            return None
+        return self.tokens[token]
+
+    def findPrevious(self, query, before=None):
+        """ Last line number before a line matching query, None if none """
+        with self.lock:
+            if before is None:
+                before = self.count
+            lines = self.getPostings(query)
+            if lines is not None:
+                i = bisect.bisect_left(lines, before)
+                if i and lines[i - 1] >= self.base:
+                    return lines[i - 1]
+                return None
+        pattern = getPattern(query)
+        for first, text, offsets in reversed(self.getBlocks()):
+            if first >= before:
+                continue
+            end = offsets[min(before - first, len(offsets) - 1)]
+            last = None
+            for match in pattern.finditer(text, 0, max(0, end - 1)):
+                last = match
+            if last is not None:
+                return first + bisect.bisect_right(offsets, last.start()) - 1
+        return None
+
+    def findNext(self, query, after):
+        """ First line number after a line matching query, None if none """
+        with self.lock:
+            lines = self.getPostings(query)
+            if lines is not None:
+                i = bisect.bisect_right(lines, max(after, self.base - 1))
+                return lines[i] if i < len(lines) else None
+        pattern = getPattern(query)
+        for first, text, offsets in self.getBlocks():
+            if first + len(offsets) - 1 <= after + 1:
+                continue
+            start = offsets[max(0, after + 1 - first)]
+            match = pattern.search(text, start)
+            if match is not None:
+                return first + bisect.bisect_right(offsets, match.start()) - 1
+        return None
+
+
+class SessionIndexer(QtCore.QObject):
+
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.indexes = set()
+        """ Index interval (s) of the background thread, also the stop latency """
+        self.interval = 0.1
+        self.run = False
+        self.stopped = threading.Event()
+
+    def add(self, index):
+        """ Called from GUI thread when a terminal opens """
+        self.indexes.add(index)
+        if not self.run:
+            self.run = True
+            self.stopped.clear()
+            QtCore.QCoreApplication.instance().aboutToQuit.connect(self.stop)
+            self.pool.start(IndexWriter(self))
+
+    def remove(self, index):
+        """ Called when the terminal or the channel closes """
+        self.indexes.discard(index)
+
+    @QtCore.Slot()
+    def stop(self):
+        self.run = False
+        self.stopped.set()
+        self.pool.waitForDone()
+
+    def errorThreadMsg(self, e):
+        msg = "Error occurred in IndexWriter thread process: {}\n"
+        FreeCAD.Console.PrintError(msg.format(e))
+
+    def errorIndexMsg(self, e):
+        msg = "Error occurred indexing terminal lines: {}\n"
+        FreeCAD.Console.PrintError(msg.format(e))
+
+
+class IndexWriter(QtCore.QRunnable):
+
+    def __init__(self, indexer):
+        QtCore.QRunnable.__init__(self)
+        self.indexer = indexer
+        """ Indexes in error, reported once until a line is indexed again """
+        self.failed = set()
+
+    def run(self):
+        """ Index the lines pushed until stop """
+        indexer = self.indexer
+        try:
+            while indexer.run:
+                for index in list(indexer.indexes):
+                    self.update(index)
+                indexer.stopped.wait(indexer.interval)
+        except Exception as e:
+            indexer.errorThreadMsg(e)
+            # Next add starts a new writer
+            indexer.run = False
+
+    def update(self, index):
+        """ A failing index loses its line, the others are still indexed """
+        try:
+            if index.update():
+                self.failed.discard(index)
+        except Exception as e:
+            if index not in self.failed:
+                self.failed.add(index)
+                self.indexer.errorIndexMsg(e)
+
+
+Indexer = SessionIndexer()
+
+
+FreeCAD.Console.PrintLog("Loading SessionIndex... done\n")
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2015 Pierre Vacher <prrvchr@gmail.com>                  *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+""" Session log object """
+from __future__ import unicode_literals
+
+import FreeCAD, os, time, gzip, shutil, threading, collections
+from PySide import QtCore
+from App import Script
+
+
+def getPath(channel):
+    return os.path.join(Script.getCachePath("Logs"), "{}.log".format(channel))
+
+
+class SessionLog:
+
+    def __init__(self, channel, size, files, compress):
+        path = Script.getCachePath("Logs")
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = getPath(channel)
+        """ Rotation when file is larger (bytes), rotated files kept """
+        self.size = size
+        self.files = files
+        self.compress = compress
+        self.file = open(self.path, "ab")
+        self.length = self.file.tell()
+
+    def write(self, t, direction, data):
+        """ direction: RX, TX, or TX! for a write that failed or timed out """
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
+        # Escaped: control chars and non ASCII bytes stay visible on one line
+        record = "{}.{:03d} {} {}\n".format(stamp, int(t * 1000) % 1000, direction,
+                                            data.encode("unicode_escape").decode("ascii"))
+        record = record.encode("ascii")
+        self.file.write(record)
+        self.length += len(record)
+        if self.length >= self.size:
+            self.rotate()
+
+    def getName(self, i):
+        return "{}.{}{}".format(self.path, i, ".gz" if self.compress else "")
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.files - 1, 0, -1):
+            if os.path.exists(self.getName(i)):
+                os.rename(self.getName(i), self.getName(i + 1))
+        if self.files > 0 and self.compress:
+            with open(self.path, "rb") as src:
+                with gzip.open(self.getName(1), "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+            os.remove(self.path)
+        elif self.files > 0:
+            os.rename(self.path, self.getName(1))
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "ab")
+        self.length = 0
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class SessionLogger(QtCore.QObject):
+
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        """ Records (time, channel, direction, data): deque append and popleft
+            are atomic, serial threads never wait on a lock """
+        self.queue = collections.deque()
+        """ Records queued above this limit are dropped, counted by the caller """
+        self.limit = 100000
+        """ Write interval (s) of the background thread, also the stop latency """
+        self.interval = 0.2
+        self.settings = {}
+        self.run = False
+        self.stopped = threading.Event()
+
+    def open(self, channel, size, files, compress):
+        """ Called from GUI thread when a channel opens """
+        self.settings[channel] = (size, files, compress)
+        if not self.run:
+            self.run = True
+            self.stopped.clear()
+            QtCore.QCoreApplication.instance().aboutToQuit.connect(self.stop)
+            self.pool.start(LogWriter(self))
+
+    def close(self, channel):
+        self.queue.append((time.time(), channel, None, None))
+
+    def log(self, channel, direction, data):
+        """ Called from serial threads: never block, False if dropped """
+        if len(self.queue) >= self.limit:
+            return False
+        self.queue.append((time.time(), channel, direction, data))
+        return True
+
+    @QtCore.Slot()
+    def stop(self):
+        self.run = False
+        self.stopped.set()
+        self.pool.waitForDone()
+
+    def errorThreadMsg(self, e):
+        msg = "Error occurred in LogWriter thread process: {}\n"
+        FreeCAD.Console.PrintError(msg.format(e))
+
+    def errorChannelMsg(self, channel, e):
+        msg = "Error occurred writing session log {}: {}\n"
+        FreeCAD.Console.PrintError(msg.format(channel, e))
+
+
+class LogWriter(QtCore.QRunnable):
+
+    def __init__(self, logger):
+        QtCore.QRunnable.__init__(self)
+        self.logger = logger
+        self.logs = {}
+        """ Channels in error, reported once until a record is written again """
+        self.failed = set()
+
+    def run(self):
+        """ Drain the queue to the channel files until stop """
+        logger = self.logger
+        try:
+            while logger.run or logger.queue:
+                self.drain()
+                logger.stopped.wait(logger.interval)
+        except Exception as e:
+            logger.errorThreadMsg(e)
+            # Next open starts a new writer
+            logger.run = False
+        finally:
+            for log in self.logs.values():
+                log.close()
+            self.logs = {}
+
+    def drain(self):
+        queue = self.logger.queue
+        while queue:
+            t, channel, direction, data = queue.popleft()
+            try:
+                self.write(t, channel, direction, data)
+            except (IOError, OSError) as e:
+                self.onError(channel, e)
+        for channel, log in self.logs.items():
+            try:
+                log.flush()
+            except (IOError, OSError) as e:
+                self.onError(channel, e)
+
+    def write(self, t, channel, direction, data):
+        log = self.logs.get(channel)
+        if direction is None:
+            if log is not None:
+                del self.logs[channel]
+                log.close()
+            return
+        if log is None:
+            log = self.logs[channel] = SessionLog(channel, *self.logger.settings[channel])
+        log.write(t, direction, data)
+        self.failed.discard(channel)
+
+    def onError(self, channel, e):
+        """ Record lost (disk full, rotation...): the file is reopened by the next record """
+        if channel not in self.failed:
+            self.failed.add(channel)
+            self.logger.errorChannelMsg(channel, e)
+        log = self.logs.pop(channel, None)
+        if log is not None:
+            try:
+                log.close()
+            except (IOError, OSError):
+                pass
+
+
+Logger = SessionLogger()
+
+
+FreeCAD.Console.PrintLog("Loading SessionLog... done\n")
@@ -93,5 +93,10 @@ class Pool(UsbPool.Pool):
         obj.Id = extra["id"]
         obj.Message = extra["msg"]
 
+    def onChanged(self, obj, prop):
+        # Usb_Start: the recorded positions restart with the uploaded file
+        if prop == "Start" and obj.Start:
+            self.Machine.startJob()
+
 
 FreeCAD.Console.PrintLog("Loading TinyG2... done\n")
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2015 Pierre Vacher <prrvchr@gmail.com>                  *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+""" TinyG2 path Deviation object """
+from __future__ import unicode_literals
+
+import FreeCAD
+from PySide import QtCore
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+""" Percentiles reported with the maximum and mean deviation """
+PERCENTILES = (50, 95, 99)
+""" Points queried at once """
+CHUNK = 65536
+""" Candidate pairs (point, piece) computed at once, bounds the memory """
+PAIRS = 1 << 20
+
+
+def getSegments(coords, lengths):
+    """ Segments (a, b) of the polylines returned by TinyG2Preview.interpolate """
+    coords = numpy.asarray(coords, dtype=numpy.float64)
+    valid = numpy.ones(len(coords) - 1, dtype=bool)
+    valid[numpy.cumsum(lengths)[:-1] - 1] = False
+    return coords[:-1][valid], coords[1:][valid]
+
+def getDistances(points, a, b):
+    """ Distance of each point to the segment [a, b] of the same row """
+    d = (b - a).T
+    l = (d * d).sum(axis=0)
+    return numpy.sqrt(getSquares(points.T, a.T, d, 1.0 / numpy.where(l > 0, l, 1.0)))
+
+def getSquares(p, a, d, inverse):
+    """ Squared distances, on coordinate rows: (x, y, z) by points """
+    vx, vy, vz = p[0] - a[0], p[1] - a[1], p[2] - a[2]
+    t = numpy.clip((vx * d[0] + vy * d[1] + vz * d[2]) * inverse, 0.0, 1.0)
+    vx -= t * d[0]
+    vy -= t * d[1]
+    vz -= t * d[2]
+    return vx * vx + vy * vy + vz * vz
+
+
+class SegmentGrid:
+
+    def __init__(self, a, b, size=None):
+        lengths = numpy.sqrt(((b - a) ** 2).sum(axis=1))
+        low = numpy.minimum(a, b).min(axis=0)
+        high = numpy.maximum(a, b).max(axis=0)
+        if size is None:
+            positive = lengths[lengths > 0]
+            median = numpy.median(positive) if len(positive) else 0.0
+            size = max(median / 2, (high - low).max() * 1e-4, 1e-9)
+        self.size = size
+        self.extent = (high - low).max()
+        """ Segments kept: coarser grids split them in fewer pieces """
+        self.segment = (a, b)
+        # Long segments are split in pieces not longer than a cell
+        n = numpy.maximum(1, numpy.ceil(lengths / size)).astype(numpy.int64)
+        self.segments = numpy.repeat(numpy.arange(len(a)), n)
+        k = numpy.arange(len(self.segments)) - numpy.repeat(numpy.cumsum(n) - n, n)
+        f = (k / n[self.segments].astype(numpy.float64))[:, None]
+        g = ((k + 1) / n[self.segments].astype(numpy.float64))[:, None]
+        d = (b - a)[self.segments]
+        self.a = a[self.segments] + d * f
+        self.b = a[self.segments] + d * g
+        # Coordinate rows of the pieces for the distance computation
+        self.rows = numpy.ascontiguousarray(self.a.T)
+        self.delta = numpy.ascontiguousarray((self.b - self.a).T)
+        l = (self.delta * self.delta).sum(axis=0)
+        self.inverse = 1.0 / numpy.where(l > 0, l, 1.0)
+        # Each piece is binned in the cells its box, grown by margin, overlaps:
+        # all the pieces nearer than margin of a point are in the point cell
+        self.margin = size / 2
+        self.origin = low - 2 * size
+        self.shape = numpy.floor((high - self.origin) / size).astype(numpy.int64) + 3
+        lo = self.getCells(numpy.minimum(self.a, self.b) - self.margin)
+        hi = self.getCells(numpy.maximum(self.a, self.b) + self.margin)
+        keys, pieces = [], []
+        # A piece up to a cell long, grown by half a cell each side, spans 3 cells
+        for dx in range(3):
+            for dy in range(3):
+                for dz in range(3):
+                    cells = lo + (dx, dy, dz)
+                    inside = numpy.flatnonzero((cells <= hi).all(axis=1))
+                    keys.append(self.getKeys(cells[inside]))
+                    pieces.append(inside)
+        keys = numpy.concatenate(keys)
+        pieces = numpy.concatenate(pieces)
+        order = numpy.argsort(keys, kind="mergesort")
+        self.keys, self.starts = numpy.unique(keys[order], return_index=True)
+        self.stops = numpy.r_[self.starts[1:], len(order)]
+        self.pieces = pieces[order]
+        self.coarser = None
+
+    def getCells(self, points):
+        return numpy.floor((points - self.origin) / self.size).astype(numpy.int64)
+
+    def getKeys(self, cells):
+        return (cells[:, 0] * self.shape[1] + cells[:, 1]) * self.shape[2] + cells[:, 2]
+
+    def query(self, points):
+        """ Distance of each point to the nearest segment """
+        points = numpy.asarray(points, dtype=numpy.float64)
+        distances = numpy.empty(len(points))
+        for i in range(0, len(points), CHUNK):
+            distances[i:i + CHUNK] = self.queryChunk(points[i:i + CHUNK])
+        return distances
+
+    def queryChunk(self, points):
+        best = numpy.full(len(points), numpy.inf)
+        cells = self.getCells(points)
+        inside = numpy.flatnonzero(((cells >= 0) & (cells < self.shape)).all(axis=1))
+        keys = self.getKeys(cells[inside])
+        pos = numpy.minimum(numpy.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = self.keys[pos] == keys
+        inside, pos = inside[found], pos[found]
+        if len(inside):
+            best[inside] = numpy.sqrt(self.getSquares(points, inside, pos))
+        # Exact within margin, else searched again in a coarser grid
+        far = numpy.flatnonzero(best > self.margin)
+        if len(far):
+            best[far] = self.getCoarser(far, points)
+        return best
+
+    def getSquares(self, points, inside, pos):
+        """ Nearest squared distance of points[inside] to the pieces of their cells pos """
+        squares = numpy.empty(len(inside))
+        counts = self.stops[pos] - self.starts[pos]
+        total = numpy.cumsum(counts)
+        i = 0
+        while i < len(inside):
+            # Points whose candidate pairs fit in PAIRS, at least one point
+            j = max(i + 1, numpy.searchsorted(total, total[i] - counts[i] + PAIRS, "right"))
+            if counts[i] > PAIRS:
+                squares[i] = self.getPointSquare(points[inside[i]], self.starts[pos[i]],
+                                                 self.stops[pos[i]])
+            else:
+                c = counts[i:j]
+                p = numpy.repeat(inside[i:j], c)
+                first = numpy.cumsum(c) - c
+                k = numpy.repeat(self.starts[pos[i:j]] - first, c)
+                q = self.pieces[k + numpy.arange(c.sum())]
+                s = getSquares(points[p].T, self.rows[:, q], self.delta[:, q], self.inverse[q])
+                squares[i:j] = numpy.minimum.reduceat(s, first)
+            i = j
+        return squares
+
+    def getPointSquare(self, point, start, stop):
+        """ Nearest squared distance of one point to the pieces[start:stop], by PAIRS """
+        p = point[:, None]
+        square = numpy.inf
+        for i in range(start, stop, PAIRS):
+            q = self.pieces[i:min(i + PAIRS, stop)]
+            s = getSquares(p, self.rows[:, q], self.delta[:, q], self.inverse[q])
+            square = min(square, s.min())
+        return square
+
+    def getAllSquares(self, points):
+        """ Nearest squared distance of points to all the pieces, by PAIRS pairs """
+        squares = numpy.full(len(points), numpy.inf)
+        step = min(len(self.a), PAIRS)
+        n = max(1, PAIRS // step)
+        for i in range(0, len(points), n):
+            # Points by pieces matrix, broadcast on coordinate rows
+            p = points[i:i + n].T[:, :, None]
+            for j in range(0, len(self.a), step):
+                s = getSquares(p, self.rows[:, j:j + step], self.delta[:, j:j + step],
+                               self.inverse[j:j + step])
+                squares[i:i + n] = numpy.minimum(squares[i:i + n], s.min(axis=1))
+        return squares
+
+    def getCoarser(self, far, points):
+        if self.size >= self.extent:
+            # Everything is in one cell: brute force for these outliers
+            return numpy.sqrt(self.getAllSquares(points[far]))
+        if self.coarser is None:
+            self.coarser = SegmentGrid(self.segment[0], self.segment[1], self.size * 8)
+        return self.coarser.queryChunk(points[far])
+
+
+def getStatistics(distances):
+    if not len(distances):
+        return {"count": 0}
+    statistics = {"count": len(distances),
+                  "max": float(distances.max()),
+                  "mean": float(distances.mean())}
+    for p, value in zip(PERCENTILES, numpy.percentile(distances, PERCENTILES)):
+        statistics["p{}".format(p)] = float(value)
+    return statistics
+
+def getColors(distances, scale):
+    """ Green to red rgb of each deviation, red from scale """
+    f = numpy.clip(distances / (scale or 1.0), 0.0, 1.0)
+    return numpy.column_stack((f, 1.0 - f, numpy.zeros(len(f)))).tolist()
+
+def analyse(path, store, count=None):
+    """ Deviations of the store positions [0:count] from the path file and their statistics """
+    if numpy is None:
+        raise ImportError("NumPy is required for the deviation analysis")
+    from App import TinyG2Preview
+    coords, lengths, rapids = TinyG2Preview.interpolate(TinyG2Preview.parse(path))
+    if not lengths or not len(store) or count == 0:
+        return numpy.zeros(0), getStatistics(numpy.zeros(0))
+    grid = SegmentGrid(*getSegments(coords, lengths))
+    distances = grid.query(store.getCoords(0, count))
+    return distances, getStatistics(distances)
+
+
+class DeviationAnalysis(QtCore.QObject):
+
+    analysed = QtCore.Signal(object)
+    """ (distances, colors, statistics) or the exception raised, in GUI thread """
+    finished = QtCore.Signal(object)
+
+    def __init__(self, path, store):
+        QtCore.QObject.__init__(self)
+        self.path = path
+        self.store = store
+        """ Positions analysed: the store keeps growing meanwhile """
+        self.count = len(store)
+        self.generation = store.generation
+        # Emitted by the worker, received here in GUI thread
+        self.analysed.connect(self.onAnalysed)
+
+    def start(self):
+        Pool.start(DeviationWorker(self))
+
+    @QtCore.Slot(object)
+    def onAnalysed(self, result):
+        self.finished.emit(result)
+        if self in Analyses:
+            Analyses.remove(self)
+
+
+class DeviationWorker(QtCore.QRunnable):
+
+    def __init__(self, analysis):
+        QtCore.QRunnable.__init__(self)
+        self.analysis = analysis
+
+    def run(self):
+        """ Whole analysis, per position colors included, out of GUI thread """
+        analysis = self.analysis
+        try:
+            distances, statistics = analyse(analysis.path, analysis.store, analysis.count)
+            colors = []
+            if statistics["count"]:
+                colors = getColors(distances, statistics["p99"] or statistics["max"])
+            analysis.analysed.emit((distances, colors, statistics))
+        except Exception as e:
+            # Always answered: the view provider waits for it to start another one
+            analysis.analysed.emit(e)
+
+
+""" Analyses running, kept alive until finished """
+Analyses = []
+Pool = QtCore.QThreadPool()
+
+def start(path, store, finished=None):
+    """ Analyse store positions against the path file in a worker thread """
+    analysis = DeviationAnalysis(path, store)
+    Analyses.append(analysis)
+    if finished is not None:
+        analysis.finished.connect(finished)
+    analysis.start()
+    return analysis
+
+
+FreeCAD.Console.PrintLog("Loading TinyG2Deviation... done\n")
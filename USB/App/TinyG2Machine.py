@@ -24,11 +24,45 @@
 """ TinyG2 StateMachine document object """
 from __future__ import unicode_literals
 
-from App import UsbPoolMachine, PySerialState
+from App import UsbPoolMachine, PySerialState, TinyG2Decoder, TinyG2Positions, EchoFilter
+
+
+""" Machine states (stat) of a job in progress: Run, Hold, Probe, Cycle, Homing, Jog """
+BUSY = (5, 6, 7, 8, 9, 10)
+""" Default echo filtered during a job: line acknowledgements and reports, text mode ok """
+ECHO_KEYS = ["r", "sr", "qr"]
+ECHO_PATTERNS = [r"^\s*ok\b", r"^\s*$"]
 
 
 class PoolMachine(UsbPoolMachine.PoolMachine):
 
+    def __init__(self):
+        UsbPoolMachine.PoolMachine.__init__(self)
+        self.decoder = TinyG2Decoder.Decoder()
+        self.positions = TinyG2Positions.PositionStore()
+        # Set from the EchoKeys and EchoPatterns view properties
+        self.filter = EchoFilter.EchoFilter(ECHO_KEYS, ECHO_PATTERNS)
+        self.busy = False
+        self.job = False
+
+    def startJob(self):
+        """ Called at upload start: positions are cleared at the next report """
+        self.job = True
+
+    def decode(self, line):
+        updates = self.decoder.decode(line)
+        for key, column, value in updates:
+            if key == "sr":
+                # Cleared here, in reader thread, where positions are appended
+                if self.job:
+                    self.job = False
+                    self.positions.clear()
+                if "stat" in value:
+                    self.busy = value["stat"] in BUSY
+                    self.filter.setBusy(self.busy)
+                self.positions.report(value)
+        return updates
+
     def setMachine(self, obj):
         self.obj = obj
         self.Serials[0].obj = obj.Serials[0]
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2015 Pierre Vacher <prrvchr@gmail.com>                  *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+""" TinyG2 Position store object """
+from __future__ import unicode_literals
+
+import FreeCAD, time, sys, zlib, base64, threading
+from array import array
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+""" Record of a position: 6 doubles, 48 bytes """
+FIELDS = ("t", "x", "y", "z", "line", "vel")
+T, X, Y, Z, LINE, VEL = range(len(FIELDS))
+RECORD = len(FIELDS)
+
+
+class PositionStore(object):
+
+    def __init__(self, capacity=4096):
+        self._data = array(b"d", [0.0]) * (RECORD * capacity)
+        self.count = 0
+        """ Last reported values, status reports only carry the changes """
+        self.last = [0.0] * RECORD
+        """ Saved state not decoded yet """
+        self.state = None
+        self.lock = threading.Lock()
+        """ Incremented when cleared, views redraw from the start """
+        self.generation = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def data(self):
+        if self._data is None:
+            self.load()
+        return self._data
+
+    def __getstate__(self):
+        # Packed doubles: save time follows the data size, not the objects
+        if self.state is not None:
+            return self.state
+        raw = self._data[:self.count * RECORD].tostring()
+        return {"records": self.count,
+                "format": "d",
+                "byteorder": sys.byteorder,
+                "last": self.last,
+                "data": base64.b64encode(zlib.compress(raw, 1)).decode("ascii")}
+
+    def __setstate__(self, state):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self._data = None
+        self.count = state["records"]
+        self.last = list(state["last"] or [0.0] * RECORD)
+        self.state = state
+
+    def load(self):
+        """ Decode the saved state, on first use of the records """
+        with self.lock:
+            if self._data is not None:
+                return
+            data = array(b"d")
+            data.fromstring(zlib.decompress(base64.b64decode(self.state["data"])))
+            if self.state["byteorder"] != sys.byteorder:
+                data.byteswap()
+            data.extend([0.0] * RECORD * max(4096, self.count))
+            self._data = data
+            self.state = None
+
+    def grow(self):
+        # Readers keep a valid view of the previous array: never resized in place
+        data = array(b"d", [0.0]) * (2 * len(self.data))
+        data[:len(self.data)] = self.data
+        self._data = data
+
+    def append(self, record):
+        """ Called in reader thread: the record is published by the count update """
+        i = self.count * RECORD
+        if i == len(self.data):
+            self.grow()
+        data = self.data
+        for j in range(RECORD):
+            data[i + j] = record[j]
+        self.count += 1
+
+    def report(self, sr):
+        """ Append the position carried by a status report, if any """
+        if not ("posx" in sr or "posy" in sr or "posz" in sr):
+            for key, field in (("line", LINE), ("vel", VEL)):
+                if key in sr:
+                    self.last[field] = sr[key]
+            return
+        last = self.last
+        last[T] = time.time()
+        for key, field in (("posx", X), ("posy", Y), ("posz", Z), ("line", LINE), ("vel", VEL)):
+            if key in sr:
+                last[field] = sr[key]
+        self.append(last)
+
+    def clear(self):
+        """ Called in reader thread at upload start: readers keep a valid view of the previous array """
+        self._data = array(b"d", [0.0]) * (RECORD * 4096)
+        self.state = None
+        self.count = 0
+        # Last reported values are kept: the machine did not move
+        self.generation += 1
+
+    def getSlice(self, start=0, stop=None):
+        """ Read only view (no copy) of the records [start:stop] as doubles """
+        count = self.count
+        stop = count if stop is None else min(stop, count)
+        return buffer(self.data, start * RECORD * 8, max(0, stop - start) * RECORD * 8)
+
+    def getArray(self, start=0, stop=None):
+        """ NumPy (n, 6) view of the records [start:stop], None without NumPy """
+        if numpy is None:
+            return None
+        return numpy.frombuffer(self.getSlice(start, stop), dtype=numpy.float64).reshape(-1, RECORD)
+
+    def getCoords(self, start=0, stop=None):
+        """ (x, y, z) of the records [start:stop]: NumPy view or list """
+        if numpy is None:
+            return self.getPoints(start, stop)
+        return self.getArray(start, stop)[:, X:Z + 1]
+
+    def getPoints(self, start=0, stop=None):
+        """ List of (x, y, z) of the records [start:stop] """
+        count = self.count
+        stop = count if stop is None else min(stop, count)
+        data = self.data
+        return [tuple(data[i * RECORD + X:i * RECORD + Z + 1]) for i in range(start, stop)]
+
+
+def fromPoints(points):
+    """ Store of the [x, y, z] list saved by older documents """
+    store = PositionStore(max(1, len(points)))
+    for p in points:
+        store.append((0.0, p[0], p[1], p[2], 0.0, 0.0))
+    return store
+
+def simplify(points, tolerance):
+    """ Douglas-Peucker: indices of the points kept within tolerance """
+    n = len(points)
+    if n < 3:
+        return list(range(n))
+    if numpy is None:
+        return simplifyList(points, tolerance)
+    p = numpy.asarray(points, dtype=numpy.float64)
+    keep = numpy.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    tolerance *= tolerance
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        # Distances of all the inner points to segment [i, j] at once
+        d = p[j] - p[i]
+        v = p[i + 1:j] - p[i]
+        l = d.dot(d)
+        if l > 0:
+            t = numpy.clip(v.dot(d) / l, 0.0, 1.0)
+            v = v - t[:, None] * d
+        dist = (v * v).sum(axis=1)
+        k = int(dist.argmax())
+        if dist[k] > tolerance:
+            k += i + 1
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return numpy.flatnonzero(keep).tolist()
+
+def simplifyList(points, tolerance):
+    n = len(points)
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    tolerance *= tolerance
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        a, b = points[i], points[j]
+        d = [b[0] - a[0], b[1] - a[1], b[2] - a[2]]
+        l = d[0] * d[0] + d[1] * d[1] + d[2] * d[2]
+        k, m = None, tolerance
+        for h in range(i + 1, j):
+            v = [points[h][0] - a[0], points[h][1] - a[1], points[h][2] - a[2]]
+            if l > 0:
+                t = min(1.0, max(0.0, (v[0] * d[0] + v[1] * d[1] + v[2] * d[2]) / l))
+                v = [v[0] - t * d[0], v[1] - t * d[1], v[2] - t * d[2]]
+            dist = v[0] * v[0] + v[1] * v[1] + v[2] * v[2]
+            if dist > m:
+                k, m = h, dist
+        if k is not None:
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return [i for i in range(n) if keep[i]]
+
+
+FreeCAD.Console.PrintLog("Loading TinyG2Positions... done\n")
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2015 Pierre Vacher <prrvchr@gmail.com>                  *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+""" TinyG2 G-code Preview object """
+from __future__ import unicode_literals
+
+import FreeCAD, re, math
+from array import array
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+""" Move kinds """
+RAPID, FEED, CW, CCW = range(4)
+""" Axes (first, second, normal) of the arc planes G17, G18, G19 """
+PLANES = ((0, 1, 2), (2, 0, 1), (1, 2, 0))
+""" Chord tolerance in file units, inches and mm """
+TOLERANCE = {20: 0.0005, 21: 0.01}
+
+WORD = re.compile(r"([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))")
+COMMENT = re.compile(r"\([^)]*\)|;.*")
+""" Non modal G codes whose axis words are not a move """
+NOMOVE = (4.0, 10.0, 28.0, 30.0, 53.0, 92.0)
+
+
+class Toolpath(object):
+
+    def __init__(self):
+        """ One entry per move: kind, end (x, y, z), arc center offset (i, j, k), plane """
+        self.kinds = array(b"b")
+        self.ends = array(b"d")
+        self.centers = array(b"d")
+        self.planes = array(b"b")
+        self.start = (0.0, 0.0, 0.0)
+        self.unit = 21
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def getTolerance(self):
+        return TOLERANCE[self.unit]
+
+
+def parse(path):
+    with open(path) as f:
+        return parseLines(f)
+
+def parseLines(lines):
+    """ Return the Toolpath of G-code lines """
+    toolpath = Toolpath()
+    position = [0.0, 0.0, 0.0]
+    motion = None
+    relative = False
+    plane = 0
+    for line in lines:
+        line = line.upper()
+        if "(" in line or ";" in line:
+            line = COMMENT.sub("", line)
+        words = WORD.findall(line)
+        if not words:
+            continue
+        axes = {}
+        offsets = [0.0, 0.0, 0.0]
+        radius = None
+        skip = False
+        for letter, value in words:
+            if letter == "G":
+                g = float(value)
+                if g in (0.0, 1.0, 2.0, 3.0):
+                    motion = int(g)
+                elif g in (17.0, 18.0, 19.0):
+                    plane = int(g) - 17
+                elif g in (90.0, 91.0):
+                    relative = g == 91.0
+                elif g in (20.0, 21.0):
+                    toolpath.unit = int(g)
+                elif g in NOMOVE:
+                    skip = True
+            elif letter in "XYZ":
+                axes["XYZ".index(letter)] = float(value)
+            elif letter in "IJK":
+                offsets["IJK".index(letter)] = float(value)
+            elif letter == "R":
+                radius = float(value)
+        if skip or not axes or motion is None:
+            continue
+        end = list(position)
+        for i, v in axes.iteritems():
+            end[i] = position[i] + v if relative else v
+        if motion >= CW and radius is not None:
+            offsets = getOffsets(position, end, radius, motion, plane)
+        if not len(toolpath):
+            toolpath.start = tuple(position)
+        toolpath.kinds.append(motion)
+        toolpath.ends.extend(end)
+        toolpath.centers.extend(offsets)
+        toolpath.planes.append(plane)
+        position = end
+    return toolpath
+
+def getOffsets(start, end, radius, motion, plane):
+    """ Arc center offset from the R word: negative R is the long arc """
+    a, b, c = PLANES[plane]
+    dx, dy = end[a] - start[a], end[b] - start[b]
+    h = math.hypot(dx, dy) / 2
+    if h == 0:
+        return [0.0, 0.0, 0.0]
+    d = math.sqrt(max(0.0, radius * radius - h * h)) / (2 * h)
+    if (motion == CW) == (radius > 0):
+        d = -d
+    offsets = [0.0, 0.0, 0.0]
+    offsets[a] = dx / 2 - d * dy
+    offsets[b] = dy / 2 + d * dx
+    return offsets
+
+
+def interpolate(toolpath, tolerance=None):
+    """ Return the polylines of a Toolpath: coords (x, y, z), lengths and rapid flags """
+    if tolerance is None:
+        tolerance = toolpath.getTolerance()
+    if not len(toolpath):
+        return [], [], []
+    if numpy is None:
+        return interpolateList(toolpath, tolerance)
+    kinds = numpy.frombuffer(toolpath.kinds, dtype=numpy.int8)
+    ends = numpy.frombuffer(toolpath.ends, dtype=numpy.float64).reshape(-1, 3)
+    centers = numpy.frombuffer(toolpath.centers, dtype=numpy.float64).reshape(-1, 3)
+    planes = numpy.frombuffer(toolpath.planes, dtype=numpy.int8)
+    starts = numpy.vstack((toolpath.start, ends[:-1]))
+    counts = numpy.ones(len(kinds), dtype=numpy.int64)
+    arcs = numpy.flatnonzero(kinds >= CW)
+    # All the arcs at once, in their plane axes (first, second, normal)
+    axes = numpy.array(PLANES)[planes[arcs]]
+    rows = numpy.arange(len(arcs))[:, None]
+    s = starts[arcs][rows, axes]
+    e = ends[arcs][rows, axes]
+    c = s + centers[arcs][rows, axes]
+    r = numpy.hypot(s[:, 0] - c[:, 0], s[:, 1] - c[:, 1])
+    a0 = numpy.arctan2(s[:, 1] - c[:, 1], s[:, 0] - c[:, 0])
+    d = numpy.arctan2(e[:, 1] - c[:, 1], e[:, 0] - c[:, 0]) - a0
+    ccw = kinds[arcs] == CCW
+    d = numpy.where(ccw & (d <= 1e-9), d + 2 * math.pi, d)
+    d = numpy.where(~ccw & (d >= -1e-9), d - 2 * math.pi, d)
+    # Chord of sagitta tolerance: step = 2 acos(1 - tolerance / r)
+    step = 2 * numpy.arccos(numpy.clip(1 - tolerance / numpy.maximum(r, 1e-12), -1, 1))
+    step = numpy.clip(step, 1e-6, math.pi / 2)
+    n = numpy.maximum(1, numpy.ceil(numpy.abs(d) / step)).astype(numpy.int64)
+    counts[arcs] = n
+    offsets = numpy.cumsum(counts) - counts
+    points = numpy.empty((int(counts.sum()), 3))
+    lines = numpy.flatnonzero(kinds < CW)
+    points[offsets[lines]] = ends[lines]
+    if len(arcs):
+        i = numpy.repeat(numpy.arange(len(arcs)), n)
+        k = numpy.arange(len(i)) - numpy.repeat(numpy.cumsum(n) - n, n) + 1
+        f = k / n[i].astype(numpy.float64)
+        angle = a0[i] + d[i] * f
+        dest = numpy.repeat(offsets[arcs], n) + k - 1
+        axis = axes[i]
+        points[dest, axis[:, 0]] = c[i, 0] + r[i] * numpy.cos(angle)
+        points[dest, axis[:, 1]] = c[i, 1] + r[i] * numpy.sin(angle)
+        points[dest, axis[:, 2]] = s[i, 2] + (e[i, 2] - s[i, 2]) * f
+        points[offsets[arcs] + n - 1] = ends[arcs]
+    # One polyline per run of rapid or feed moves, from the previous end
+    rapid = kinds == RAPID
+    first = numpy.flatnonzero(numpy.r_[True, rapid[1:] != rapid[:-1]])
+    last = numpy.r_[first[1:], len(kinds)] - 1
+    begin = offsets[first]
+    lengths = offsets[last] + counts[last] - begin + 1
+    index = numpy.repeat(begin - (numpy.cumsum(lengths) - lengths), lengths) + numpy.arange(int(lengths.sum()))
+    coords = numpy.vstack((toolpath.start, points))[index]
+    return coords, lengths.tolist(), rapid[first].tolist()
+
+def interpolateList(toolpath, tolerance):
+    coords = [toolpath.start]
+    lengths, rapids = [], []
+    position = toolpath.start
+    for m, kind in enumerate(toolpath.kinds):
+        end = tuple(toolpath.ends[3 * m:3 * m + 3])
+        rapid = kind == RAPID
+        if not rapids or rapids[-1] != rapid:
+            if rapids:
+                coords.append(position)
+            lengths.append(1)
+            rapids.append(rapid)
+        if kind >= CW:
+            points = getArc(position, end, toolpath.centers[3 * m:3 * m + 3],
+                            kind, toolpath.planes[m], tolerance)
+        else:
+            points = [end]
+        coords.extend(points)
+        lengths[-1] += len(points)
+        position = end
+    return coords, lengths, rapids
+
+def getArc(start, end, offsets, kind, plane, tolerance):
+    a, b, c = PLANES[plane]
+    ca, cb = start[a] + offsets[a], start[b] + offsets[b]
+    r = math.hypot(start[a] - ca, start[b] - cb)
+    a0 = math.atan2(start[b] - cb, start[a] - ca)
+    d = math.atan2(end[b] - cb, end[a] - ca) - a0
+    if kind == CCW and d <= 1e-9:
+        d += 2 * math.pi
+    elif kind == CW and d >= -1e-9:
+        d -= 2 * math.pi
+    step = 2 * math.acos(min(1.0, max(-1.0, 1 - tolerance / max(r, 1e-12))))
+    step = min(max(step, 1e-6), math.pi / 2)
+    n = max(1, int(math.ceil(abs(d) / step)))
+    points = []
+    for k in range(1, n):
+        f = float(k) / n
+        p = [0.0, 0.0, 0.0]
+        p[a] = ca + r * math.cos(a0 + d * f)
+        p[b] = cb + r * math.sin(a0 + d * f)
+        p[c] = start[c] + (end[c] - start[c]) * f
+        points.append(tuple(p))
+    points.append(end)
+    return points
+
+
+FreeCAD.Console.PrintLog("Loading TinyG2Preview... done\n")
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2015 Pierre Vacher <prrvchr@gmail.com>                  *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+""" TinyG2 configuration Profile object """
+from __future__ import unicode_literals
+
+import FreeCAD, json
+from PySide import QtCore
+from App import TinyG2Decoder
+
+
+""" Groups saved in a profile: system, axis, motor and power """
+GROUPS = ["sys", "x", "y", "z", "a", "b", "c", "1", "2", "3", "4", "5", "6", "p1"]
+""" Firmware identification, never written """
+READONLY = ["fb", "fbs", "fv", "cv", "hp", "hv", "id"]
+""" Controller input line limit (chars, end of line included) """
+LINE_LIMIT = 254
+""" Values of unit (G20, G21): axis values of a profile are in its unit """
+UNITS = ["inches", "mm"]
+
+
+def makeProfile(values):
+    """ Return {group: {key: value}} from the values {flat key: value} """
+    profile = {}
+    if values.get("unit") is not None:
+        profile["unit"] = values["unit"]
+    for group in GROUPS:
+        for k, key in TinyG2Decoder.DICKEY["r"][group].iteritems():
+            if key not in READONLY and values.get(key) is not None:
+                profile.setdefault(group, {})[k] = values[key]
+    return profile
+
+def load(path):
+    with open(path) as f:
+        profile = json.load(f)
+    if type(profile) is not dict:
+        raise ValueError("not a TinyG2 profile: {}".format(path))
+    return profile
+
+def save(path, profile):
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=1, sort_keys=True)
+
+def isEqual(a, b):
+    if isinstance(a, (int, long, float)) and isinstance(b, (int, long, float)):
+        return abs(a - b) <= 1e-6 * max(1.0, abs(a))
+    return a == b
+
+def getUnitError(profile, current):
+    """ Return why the profile can't be applied in the current unit, None if it can """
+    unit, current = profile.get("unit"), current.get("unit")
+    # Profile saved without unit: nothing to check
+    if unit is None or current is None or unit == current:
+        return None
+    names = [UNITS[u] if u in (0, 1) else "{}".format(u) for u in (unit, current)]
+    return "saved in {}, controller in {}".format(*names)
+
+def getChanges(profile, current):
+    """ Return {flat key: value} of the profile differing from current """
+    changes = {}
+    for group in GROUPS:
+        keys = TinyG2Decoder.DICKEY["r"][group]
+        for k, value in profile.get(group, {}).iteritems():
+            key = keys.get(k)
+            if key is None or key in READONLY:
+                continue
+            if not isEqual(current.get(key), value):
+                changes[key] = value
+    return changes
+
+def getBatches(changes, limit=LINE_LIMIT - 2):
+    """ Pack flat key writes in JSON lines not longer than limit """
+    lines = []
+    batch = {}
+    for key in sorted(changes):
+        batch[key] = changes[key]
+        if len(json.dumps(batch, separators=(",", ":"))) > limit and len(batch) > 1:
+            del batch[key]
+            lines.append(json.dumps(batch, separators=(",", ":")))
+            batch = {key: changes[key]}
+    if batch:
+        lines.append(json.dumps(batch, separators=(",", ":")))
+    return lines
+
+def getGroups(changes):
+    groups = set()
+    for group in GROUPS:
+        for key in TinyG2Decoder.DICKEY["r"][group].itervalues():
+            if key in changes:
+                groups.add(group)
+    return sorted(groups)
+
+def getReadback(changes):
+    """ Return [(line, changed keys answered)] reading back the changed groups """
+    lines = []
+    for group in getGroups(changes):
+        keys = set(TinyG2Decoder.DICKEY["r"][group].itervalues()) & set(changes)
+        lines.append(('{{"{}":n}}'.format(group), keys))
+    return lines
+
+
+class ProfileWriter(QtCore.QObject):
+
+    finished = QtCore.Signal(bool)
+
+    def __init__(self, obj, profile, current):
+        QtCore.QObject.__init__(self)
+        self.obj = obj
+        self.machine = obj.Proxy.Machine
+        self.changes = getChanges(profile, current)
+        self.lines = [(line, set(json.loads(line))) for line in getBatches(self.changes)]
+        """ Keys of the lines sent and not yet acknowledged, kept under controller buffer """
+        self.inflight = []
+        self.window = 4
+        self.readback = False
+        self.values = {}
+        self.errors = 0
+
+    def start(self):
+        self.machine.serialData.connect(self.onSerialData)
+        self.startMsg()
+        self.send()
+
+    def send(self):
+        while self.lines and len(self.inflight) < self.window:
+            line, keys = self.lines.pop(0)
+            self.machine.serialWrite(line)
+            self.inflight.append(keys)
+        if self.lines or self.inflight:
+            return
+        if not self.readback:
+            # Read back only the changed groups
+            self.readback = True
+            self.lines = getReadback(self.changes)
+            self.send()
+        else:
+            self.stop()
+
+    @QtCore.Slot(object)
+    def onSerialData(self, updates):
+        keys = set(key for key, column, value in updates if key != "f")
+        for key, column, value in updates:
+            if key == "f":
+                # Acknowledges the oldest line sent when it answers its keys: lines
+                # typed or streamed meanwhile are not counted, an error may answer none
+                if not self.inflight:
+                    continue
+                if keys & self.inflight[0] or (value[1] != 0 and not keys):
+                    self.inflight.pop(0)
+                    if value[1] != 0:
+                        self.errors += 1
+            elif self.readback and key in self.changes:
+                self.values[key] = value
+        self.send()
+
+    def stop(self):
+        self.machine.serialData.disconnect(self.onSerialData)
+        failed = [k for k, v in self.changes.iteritems() if not isEqual(self.values.get(k), v)]
+        self.doneMsg(failed)
+        self.finished.emit(not failed)
+        if self in Writers:
+            Writers.remove(self)
+
+    def startMsg(self):
+        msg = "{} applying profile: {} values in {} lines...\n"
+        FreeCAD.Console.PrintMessage(msg.format(self.obj.Label, len(self.changes), len(self.lines)))
+
+    def doneMsg(self, failed):
+        if failed:
+            msg = "{} profile applied with {} errors, values not verified: {}\n"
+            FreeCAD.Console.PrintError(msg.format(self.obj.Label, self.errors, ", ".join(sorted(failed))))
+        else:
+            msg = "{} profile applied and verified... done\n"
+            FreeCAD.Console.PrintMessage(msg.format(self.obj.Label))
+
+
+""" Writers running, kept alive until finished """
+Writers = []
+
+def apply(obj, profile, current, finished=None):
+    """ Write a profile to a running TinyG2 pool, current: {flat key: value} """
+    writer = ProfileWriter(obj, profile, current)
+    Writers.append(writer)
+    # Connected before start: without changes finished is emitted by start
+    if finished is not None:
+        writer.finished.connect(finished)
+    writer.start()
+    return writer
+
+
+FreeCAD.Console.PrintLog("Loading TinyG2Profile... done\n")
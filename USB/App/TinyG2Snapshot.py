@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2015 Pierre Vacher <prrvchr@gmail.com>                  *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+""" TinyG2 configuration Snapshot object """
+from __future__ import unicode_literals
+
+import FreeCAD, json, threading
+from App import Script
+
+
+class SnapshotCache:
+
+    def __init__(self, name="snapshots.json"):
+        self.name = name
+        self.data = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.data is None:
+            try:
+                with open(Script.getCachePath(self.name)) as f:
+                    self.data = json.load(f)
+            except (IOError, ValueError):
+                self.data = {}
+        return self.data
+
+    def save(self):
+        try:
+            with open(Script.getCachePath(self.name), "w") as f:
+                json.dump(self.data, f)
+        except (IOError, OSError) as e:
+            msg = "Error occurred saving configuration snapshot: {}\n"
+            FreeCAD.Console.PrintError(msg.format(e))
+
+    def get(self, device):
+        """ Return last known configuration {key: [value, description, unit]} """
+        with self.lock:
+            if not device or device not in self.load():
+                return None
+            return self.data[device]
+
+    def set(self, device, snapshot):
+        if not device:
+            return
+        with self.lock:
+            if self.load().get(device) != snapshot:
+                self.data[device] = snapshot
+                self.save()
+
+    def remove(self, device):
+        with self.lock:
+            if device in self.load():
+                del self.data[device]
+                self.save()
+
+
+""" Configuration snapshot of each TinyG2 device id """
+Snapshots = SnapshotCache()
+
+
+FreeCAD.Console.PrintLog("Loading TinyG2Snapshot... done\n")
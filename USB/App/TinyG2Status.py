@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2015 Pierre Vacher <prrvchr@gmail.com>                  *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+""" TinyG2 Status report manager object """
+from __future__ import unicode_literals
+
+import FreeCAD, json
+from PySide import QtCore
+
+
+""" Machine states reported by the stat field """
+STATES = ("Initializing", "Ready", "Alarm", "Stop", "End", "Run", "Hold",
+          "Probe", "Cycle", "Homing", "Jog", "Interlock", "Shutdown", "Panic")
+""" Report fields needed by each view, stat is always reported """
+FIELDS = {"monitor": ["line", "posx", "posy", "posz", "vel", "feed", "stat"],
+          "drawing": ["posx", "posy", "posz"]}
+BASE = ["stat"]
+""" Status interval (ms) needed by each view, the fastest visible one wins """
+INTERVALS = {"monitor": 100, "drawing": 250}
+IDLE = 2000
+MAXIMUM = 2000
+""" GUI thread lag (ms) above which the interval is doubled, under which halved """
+HIGH = 50
+LOW = 10
+""" Minimum time (ms) between two interval changes: si is saved by the controller """
+HOLD = 5000
+
+
+class StatusManager(QtCore.QObject):
+
+    def __init__(self, obj):
+        QtCore.QObject.__init__(self)
+        self.obj = obj
+        self.views = set()
+        """ Persistent settings (sv, si, sr fields) reported by and sent to the controller """
+        self.reported = {}
+        self.sent = {}
+        self.factor = 1
+        """ GUI thread load: mean lag of a periodic timer """
+        self.lag = 0.0
+        self.clock = QtCore.QElapsedTimer()
+        self.hold = QtCore.QElapsedTimer()
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(200)
+        self.timer.timeout.connect(self.onTick)
+        obj.Proxy.Machine.ctrlStart.connect(self.onCtrlStart)
+        obj.Proxy.Machine.ctrlStop.connect(self.onCtrlStop)
+        obj.Proxy.Machine.serialData.connect(self.onSerialData)
+
+    def setVisible(self, view, visible):
+        if visible:
+            self.views.add(view)
+        else:
+            self.views.discard(view)
+        self.update()
+
+    def getFields(self):
+        fields = set(BASE)
+        for view in self.views:
+            fields.update(FIELDS[view])
+        return sorted(fields)
+
+    def getInterval(self):
+        if not self.views:
+            return IDLE
+        interval = min(INTERVALS[v] for v in self.views)
+        return min(MAXIMUM, interval * self.factor)
+
+    @QtCore.Slot()
+    def onCtrlStart(self):
+        self.reported = {}
+        self.sent = {}
+        self.factor = 1
+        self.lag = 0.0
+        # Settings are only written once read back, and only if they differ
+        machine = self.obj.Proxy.Machine
+        for line in ('{"sv":n}', '{"si":n}', '{"sr":n}'):
+            machine.serialWrite(line)
+        self.clock.start()
+        self.hold.start()
+        self.timer.start()
+
+    @QtCore.Slot()
+    def onCtrlStop(self):
+        self.timer.stop()
+
+    @QtCore.Slot(object)
+    def onSerialData(self, updates):
+        keys = set(key for key, column, value in updates)
+        changed = False
+        for key, column, value in updates:
+            if key in ("sv", "si"):
+                self.reported[key] = value
+                changed = True
+            elif key == "sr" and "f" in keys:
+                # Answered report (not an automatic one): carries all the fields set
+                self.reported["sr"] = sorted(value)
+                changed = True
+        if changed:
+            self.update()
+
+    @QtCore.Slot()
+    def onTick(self):
+        lag = max(0, self.clock.restart() - self.timer.interval())
+        self.lag = 0.8 * self.lag + 0.2 * lag
+        # Held after a change: the lag must settle before the next one
+        if self.hold.elapsed() < HOLD:
+            return
+        if self.lag > HIGH and self.getInterval() < MAXIMUM:
+            self.factor *= 2
+        elif self.lag < LOW and self.factor > 1:
+            self.factor //= 2
+        else:
+            return
+        self.hold.start()
+        self.update()
+
+    def update(self):
+        machine = self.obj.Proxy.Machine
+        if not machine.isRunning():
+            return
+        # Filtered reports: only the fields that changed are sent
+        self.setValue("sv", 1, '{"sv":1}')
+        fields = self.getFields()
+        sr = dict((f, True) for f in fields)
+        self.setValue("sr", fields, json.dumps({"sr": sr}, separators=(",", ":")))
+        interval = self.getInterval()
+        self.setValue("si", interval, '{{"si":{}}}'.format(interval))
+
+    def setValue(self, key, value, line):
+        """ Write a setting once reported, only if it differs from the controller """
+        if key not in self.reported or self.reported[key] == value:
+            return
+        if self.sent.get(key) == value:
+            return
+        self.sent[key] = value
+        self.obj.Proxy.Machine.serialWrite(line)
+
+
+FreeCAD.Console.PrintLog("Loading TinyG2Status... done\n")
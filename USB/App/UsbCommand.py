@@ -25,7 +25,7 @@
 from __future__ import unicode_literals
 
 import FreeCAD
-from App import Script
+from App import Script, UsbHotplug, UsbProbe
 
 if FreeCAD.GuiUp:
     import FreeCADGui
@@ -87,6 +87,8 @@ class CommandRefresh:
 obj.touch()'''
         FreeCADGui.doCommand(code)
         FreeCAD.ActiveDocument.recompute()
+        UsbProbe.Probe.clear()
+        UsbHotplug.Monitor.probe()
 
 
 class CommandOpen:
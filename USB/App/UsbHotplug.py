@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2015 Pierre Vacher <prrvchr@gmail.com>                  *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+""" USB Hotplug monitor object """
+from __future__ import unicode_literals
+
+import FreeCAD, os, select, time, errno, ctypes, ctypes.util
+from PySide import QtCore
+from serial.tools import list_ports_registry
+from App import Script, UsbProbe, PySerialState
+
+
+# inotify(7) events for entries created, deleted or renamed in /dev
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+
+
+class DirectoryWatch:
+
+    def __init__(self, path):
+        # Use inotify if the libc provide it, else fallback to polling
+        self.fd = None
+        self.wakeup = None
+        """ Quiet time (s) ending a burst of events while udev set the device up """
+        self.settle = 0.1
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library(b"c"), use_errno=True)
+            fd = libc.inotify_init()
+            if fd >= 0:
+                mask = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+                if libc.inotify_add_watch(fd, path.encode("utf-8"), mask) >= 0:
+                    self.fd = fd
+                    self.wakeup = PySerialState.WakeUp()
+                else:
+                    os.close(fd)
+        except (OSError, AttributeError, TypeError):
+            pass
+
+    def wait(self, timeout):
+        """ Block until a change in directory or a wake up, poll every timeout without inotify """
+        if self.fd is None:
+            time.sleep(timeout)
+            return
+        fds = [self.fd, self.wakeup]
+        ready = self.select(fds, None)
+        # Events come in burst: read them until quiet
+        while self.fd in ready:
+            os.read(self.fd, 4096)
+            ready = self.select(fds, self.settle)
+        if self.wakeup in ready:
+            self.wakeup.clear()
+
+    def select(self, fds, timeout):
+        while True:
+            try:
+                return select.select(fds, [], [], timeout)[0]
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+
+    def wakeUp(self):
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.wakeup is not None:
+            self.wakeup.close()
+
+
+class HotplugMonitor(QtCore.QObject):
+
+    portsChanged = QtCore.Signal()
+
+    def __init__(self, path="/dev"):
+        QtCore.QObject.__init__(self)
+        self.pool = QtCore.QThreadPool(self)
+        self.path = path
+        self.run = False
+        """ Polling interval (s) without inotify, also the stop latency """
+        self.interval = 0.2
+        """ Directory watched by the thread, woken up on stop """
+        self.watch = None
+        """ Reconnect attempts while udev finish the device setup """
+        self.retry = 0
+        self.retries = 10
+        self.devices = set()
+        self.portsChanged.connect(self.onPortsChanged, QtCore.Qt.QueuedConnection)
+
+    def start(self):
+        if self.run or not os.path.isdir(self.path):
+            return
+        self.run = True
+        self.devices = set(p.device for p in list_ports_registry.comports())
+        QtCore.QCoreApplication.instance().aboutToQuit.connect(self.stop)
+        self.pool.start(HotplugWatcher(self))
+
+    @QtCore.Slot()
+    def stop(self):
+        self.run = False
+        watch = self.watch
+        if watch is not None:
+            watch.wakeUp()
+        self.pool.waitForDone()
+
+    def getObjects(self, typ):
+        for doc in FreeCAD.listDocuments().values():
+            for obj in doc.Objects:
+                if Script.getObjectType(obj) == typ:
+                    yield obj
+
+    @QtCore.Slot()
+    def onPortsChanged(self):
+        for obj in self.getObjects("App::PySerial"):
+            obj.Proxy.updatePorts(obj)
+            obj.purgeTouched()
+        self.retry = 0
+        self.reconnect()
+        self.probe(True)
+
+    def getBusyPorts(self):
+        # Ports opened or about to be reopened by a pool
+        ports = []
+        for obj in self.getObjects("App::PySerial"):
+            if obj.Proxy.Serial.is_open:
+                ports.append(obj.Proxy.Serial.port)
+        for obj in self.getObjects("App::UsbPool"):
+            states = [s for s in obj.Proxy.Machine.Serials if s.obj is not None and s.lost]
+            ports.extend(self.getLostPorts(states))
+        return ports
+
+    def probe(self, added=False):
+        """ Probe unknown USB devices, only those just plugged if added """
+        devices = set(p.device for p in list_ports_registry.comports())
+        ports = UsbProbe.Probe.getCandidates(self.getBusyPorts())
+        if added:
+            ports = [p for p in ports if p not in self.devices]
+        self.devices = devices
+        UsbProbe.Probe.probe(ports)
+
+    def getLostPorts(self, states):
+        devices = {}
+        for info in list_ports_registry.comports():
+            devices.setdefault(list_ports_registry.usb_id(info), info.device)
+        return [devices.get(s.device) for s in states]
+
+    @QtCore.Slot()
+    def reconnect(self):
+        pending = False
+        for obj in self.getObjects("App::UsbPool"):
+            machine = obj.Proxy.Machine
+            states = [s for s in machine.Serials if s.obj is not None and s.lost]
+            if not states:
+                continue
+            ports = self.getLostPorts(states)
+            if None in ports:
+                continue
+            pending = True
+            if machine.isRunning():
+                continue
+            for state, port in zip(states, ports):
+                if not state.isUrl() and state.obj.Port != port:
+                    state.obj.Port = b"{}".format(port)
+            self.reconnectMsg(obj, ports)
+            machine.start(obj)
+        if pending and self.retry < self.retries:
+            self.retry += 1
+            QtCore.QTimer.singleShot(100, self.reconnect)
+
+    def reconnectMsg(self, obj, ports):
+        msg = "{} device reappeared on {}: reconnecting...\n"
+        FreeCAD.Console.PrintMessage(msg.format(obj.Label, ", ".join(ports)))
+
+    def errorThreadMsg(self, e):
+        msg = "Error occurred in HotplugWatcher thread process: {}\n"
+        FreeCAD.Console.PrintError(msg.format(e))
+
+
+class HotplugWatcher(QtCore.QRunnable):
+
+    def __init__(self, monitor):
+        QtCore.QRunnable.__init__(self)
+        self.monitor = monitor
+
+    def run(self):
+        """ Loop and watch device directory """
+        watch = DirectoryWatch(self.monitor.path)
+        self.monitor.watch = watch
+        try:
+            list_ports_registry.comports()
+            generation = list_ports_registry.registry.generation
+            while self.monitor.run:
+                watch.wait(self.monitor.interval)
+                list_ports_registry.comports()
+                if list_ports_registry.registry.generation != generation:
+                    generation = list_ports_registry.registry.generation
+                    self.monitor.portsChanged.emit()
+        except Exception as e:
+            self.monitor.errorThreadMsg(e)
+        finally:
+            self.monitor.watch = None
+            watch.close()
+
+
+Monitor = HotplugMonitor()
+
+
+FreeCAD.Console.PrintLog("Loading UsbHotplug... done\n")
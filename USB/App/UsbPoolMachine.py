@@ -25,7 +25,7 @@
 from __future__ import unicode_literals
 
 from PySide import QtCore
-import FreeCAD
+import FreeCAD, threading
 from App import PySerialState
 
 
@@ -34,6 +34,7 @@ class PoolMachine(QtCore.QStateMachine):
     ctrlStart = QtCore.Signal()
     ctrlStop = QtCore.Signal()
     serialRead = QtCore.Signal(unicode)
+    serialData = QtCore.Signal(object)
     restart = QtCore.Signal(object)
 
     def __init__(self):
@@ -43,6 +44,12 @@ class PoolMachine(QtCore.QStateMachine):
         self.run = False
         self.close = False
         self.plugin = None
+        """ Terminal echo filter, None for no filtering """
+        self.filter = None
+        self.restarting = False
+        """ Set while the StateMachine is not running """
+        self.stopped = threading.Event()
+        self.stopped.set()
 
         On = OnState(QtCore.QState.ParallelStates, self)
         On.setObjectName("On")
@@ -58,6 +65,17 @@ class PoolMachine(QtCore.QStateMachine):
         self.setInitialState(On)
         self.Serials = [Serial0, Serial1]
         self.restart.connect(self.onRestart, QtCore.Qt.QueuedConnection)
+        self.finished.connect(self.onFinished, QtCore.Qt.DirectConnection)
+
+    @QtCore.Slot()
+    def onFinished(self):
+        # OffState emit finished while still running: wait for the last one
+        if self.isRunning():
+            return
+        self.stopped.set()
+        if self.restarting:
+            self.restarting = False
+            self.restart.emit(self.obj)
 
     @QtCore.Slot(object)
     def onRestart(self, obj):
@@ -74,6 +92,7 @@ class PoolMachine(QtCore.QStateMachine):
         obj.Document.recompute()
         self.setMachine(obj)
         self.run = True
+        self.stopped.clear()
         QtCore.QStateMachine.start(self)
 
     def setMachine(self, obj):
@@ -84,15 +103,25 @@ class PoolMachine(QtCore.QStateMachine):
     def halt(self):
         self.close = False
         self.run = False
+        self.wakeUp()
 
     def stop(self):
         self.close = True
         self.run = False
+        self.wakeUp()
+
+    def wakeUp(self):
+        for state in self.Serials:
+            state.wakeUp()
 
     @QtCore.Slot(unicode)
     def serialWrite(self, data):
         self.getCtrlState().serialWrite.emit(data)
 
+    def decode(self, line):
+        """ Called in reader thread: return the updates carried by line """
+        return None
+
     def getCtrlState(self):
         return self.obj.Proxy.getCtrlState(self.obj)
 
@@ -103,6 +132,10 @@ class PoolMachine(QtCore.QStateMachine):
         msg = "Error occurred in {} StateMachine: {}\n"
         FreeCAD.Console.PrintError(msg.format(self.obj.Label, e))
 
+    def machineStopMsg(self):
+        msg = "{} StateMachine stopped... done\n"
+        FreeCAD.Console.PrintLog(msg.format(self.obj.Label))
+
     def startThread(self, thread):
         if not self.pool.maxThreadCount() > self.pool.activeThreadCount():
             self.pool.setMaxThreadCount(self.pool.activeThreadCount() +1)
@@ -143,9 +176,5 @@ class WaitMachine(QtCore.QRunnable):
 
     def run(self):
         """ Wait for StateMachine stop"""
-        try:
-            while self.machine.running:
-                pass
-            print "WaitMachine.done"
-        except Exception as e:
-            self.machine.machineErrorMsg(e)
+        self.machine.stopped.wait()
+        self.machine.machineStopMsg()
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2015 Pierre Vacher <prrvchr@gmail.com>                  *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+""" USB device probe service object """
+from __future__ import unicode_literals
+
+import FreeCAD, serial, io, json, time, threading
+from PySide import QtCore
+from serial.tools import list_ports_registry
+from App import Script
+
+
+def getPlugin(signature):
+    """ Return plugin name and extra data identified by a signature line """
+    plugin, extra = b"UsbPool", {}
+    try:
+        s = json.loads(signature)
+    except ValueError:
+        pass
+    else:
+        if type(s) is dict and s.has_key("r"):
+            r = s["r"]
+            if (r.has_key("fv") and r["fv"] >= 0.98 and
+                r.has_key("hp") and r["hp"] >= 3 and
+                r.has_key("hv") and r["hv"] >= 0 and
+                r.has_key("fb") and r["fb"] >= 83.09 and
+                r.has_key("msg") and r.has_key("id")):
+                plugin = b"TinyG2"
+                extra = {"msg": r["msg"], "id": r["id"]}
+    return plugin, extra
+
+
+class SignatureCache:
+
+    def __init__(self, name="signatures.json"):
+        self.name = name
+        self.data = None
+        """ Plain devices, kept for this session only """
+        self.plain = set()
+        self.lock = threading.Lock()
+
+    def getKey(self, device):
+        # Without serial number a VID:PID is not unique enough
+        if device is None or not device[2]:
+            return None
+        return "{:04X}:{:04X}:{}".format(device[0], device[1], device[2])
+
+    def load(self):
+        if self.data is None:
+            try:
+                with open(Script.getCachePath(self.name)) as f:
+                    data = json.load(f)
+                # Plain devices are never trusted from disk
+                self.data = dict((k, v) for k, v in data.iteritems()
+                                 if v.get("plugin") != "UsbPool")
+            except (IOError, ValueError, AttributeError):
+                self.data = {}
+        return self.data
+
+    def save(self):
+        try:
+            with open(Script.getCachePath(self.name), "w") as f:
+                json.dump(self.data, f, indent=1)
+        except (IOError, OSError) as e:
+            msg = "Error occurred saving signature cache: {}\n"
+            FreeCAD.Console.PrintError(msg.format(e))
+
+    def get(self, device):
+        key = self.getKey(device)
+        with self.lock:
+            if key in self.plain:
+                return b"UsbPool", {}
+            if key is None or key not in self.load():
+                return None
+            s = self.data[key]
+            return b"{}".format(s["plugin"]), {"msg": s["msg"], "id": s["id"]}
+
+    def set(self, device, plugin, extra):
+        key = self.getKey(device)
+        if key is None:
+            return
+        with self.lock:
+            # A late or garbled banner looks plain: never saved to disk
+            if not extra:
+                self.plain.add(key)
+                return
+            self.plain.discard(key)
+            value = {"plugin": plugin, "msg": extra["msg"], "id": extra["id"]}
+            if self.load().get(key) != value:
+                self.data[key] = value
+                self.save()
+
+    def has(self, device):
+        key = self.getKey(device)
+        with self.lock:
+            return key is not None and (key in self.plain or key in self.load())
+
+    def clear(self):
+        """ Forget all signatures, devices will be identified again """
+        with self.lock:
+            self.plain.clear()
+            self.data = {}
+            self.save()
+
+
+class ProbeService(QtCore.QObject):
+
+    probed = QtCore.Signal(unicode, unicode)
+
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        self.pool = QtCore.QThreadPool(self)
+        self.cache = SignatureCache()
+        self.busy = set()
+        self.unknown = set()
+        self.lock = threading.Lock()
+        """ Time (s) to wait for a signature after opening port """
+        self.timeout = 3.0
+        self.baudrate = 115200
+        self.probed.connect(self.probedMsg)
+
+    def getCandidates(self, exclude=()):
+        # Usb ports of unknown device, not used by a pool
+        ports = []
+        for info in list_ports_registry.comports():
+            device = list_ports_registry.usb_id(info)
+            if device is None or info.device in exclude:
+                continue
+            key = self.cache.getKey(device)
+            if key is None or key in self.unknown or self.cache.has(device):
+                continue
+            ports.append(info.device)
+        return ports
+
+    def probe(self, ports):
+        """ Probe all ports in parallel on worker threads """
+        with self.lock:
+            ports = [p for p in ports if p not in self.busy]
+            self.busy.update(ports)
+        if not ports:
+            return
+        count = self.pool.activeThreadCount() + len(ports)
+        if self.pool.maxThreadCount() < count:
+            self.pool.setMaxThreadCount(count)
+        for port in ports:
+            self.pool.start(ProbeWorker(self, port))
+
+    def clear(self):
+        with self.lock:
+            self.unknown.clear()
+        self.cache.clear()
+
+    def done(self, port, key):
+        with self.lock:
+            self.busy.discard(port)
+            if key is not None:
+                self.unknown.add(key)
+
+    @QtCore.Slot(unicode, unicode)
+    def probedMsg(self, port, plugin):
+        msg = "Probe has detected a {} on port {}\n"
+        FreeCAD.Console.PrintLog(msg.format(plugin, port))
+
+    def errorThreadMsg(self, port, e):
+        msg = "Error occurred probing port {}: {}\n"
+        FreeCAD.Console.PrintLog(msg.format(port, e))
+
+
+class ProbeWorker(QtCore.QRunnable):
+
+    def __init__(self, service, port):
+        QtCore.QRunnable.__init__(self)
+        self.service = service
+        self.port = port
+
+    def run(self):
+        """ Open port and wait for a signature """
+        key = None
+        try:
+            info = list_ports_registry.find(self.port)
+            device = list_ports_registry.usb_id(info) if info is not None else None
+            key = self.service.cache.getKey(device)
+            s = serial.Serial(self.port, baudrate=self.service.baudrate, timeout=0.1)
+            try:
+                sio = io.TextIOWrapper(io.BufferedRWPair(s, s))
+                end = time.time() + self.service.timeout
+                while time.time() < end:
+                    plugin, extra = getPlugin(sio.readline())
+                    if extra:
+                        self.service.cache.set(device, plugin, extra)
+                        self.service.probed.emit(self.port, plugin)
+                        key = None
+                        break
+            finally:
+                s.close()
+        except Exception as e:
+            self.service.errorThreadMsg(self.port, e)
+        finally:
+            # Remember device without signature for this session
+            self.service.done(self.port, key)
+
+
+Probe = ProbeService()
+
+
+FreeCAD.Console.PrintLog("Loading UsbProbe... done\n")
@@ -34,6 +34,7 @@ class PySerialBaseModel(QtCore.QAbstractItemModel):
         QtCore.QAbstractItemModel.__init__(self)
         self._header = ["Property", "Value"]
         self.properties = []
+        self.stats = []
         self.allproperties = ["BAUDRATES",
                               "BYTESIZES",
                               "PARITIES",
@@ -82,7 +83,7 @@ class PySerialBaseModel(QtCore.QAbstractItemModel):
     def rowCount(self, parent=QtCore.QModelIndex()):
         if parent.isValid():
             return 0
-        return len(self.properties)
+        return len(self.properties) + len(self.stats)
 
     def flags(self, index=QtCore.QModelIndex()):
         return QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
@@ -106,15 +107,34 @@ class PySerialModel(PySerialBaseModel):
         state.serialOpen.connect(self.updateModel)
         state.serialClose.connect(self.updateModel)
         state.serialError.connect(self.updateModel)
+        self.stats = [p for p, doc in obj.Proxy.Stats.getCounters()] + ["Latency"]
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(1000)
+        # Shown from the proxy: the Statistics properties only follow on close and recompute
+        self.timer.timeout.connect(self.refreshStats)
         self.updateModel()
 
     @QtCore.Slot()
     def updateModel(self):
         properties = self.getProperties()
-        if self.rowCount() != len(properties):
+        if len(self.properties) != len(properties):
             self.beginResetModel()
             self.properties = properties
             self.endResetModel()
+        # Need to try: on close document serialClose is emited... and obj already deleted
+        try:
+            isOpen = self.obj.Proxy.Serial.is_open
+        except ReferenceError:
+            isOpen = False
+        if isOpen:
+            self.timer.start()
+        else:
+            self.timer.stop()
+            self.refreshStats()
+
+    def refreshStats(self):
+        first = len(self.properties)
+        self.dataChanged.emit(self.index(first, 1), self.index(first + len(self.stats) - 1, 1))
 
     def getProperties(self):
         # Need to try: on close document serialClose is emited... and obj already deleted
@@ -127,6 +147,8 @@ class PySerialModel(PySerialBaseModel):
         if not index.isValid():
             return None
         if role == QtCore.Qt.DisplayRole:
+            if index.row() >= len(self.properties):
+                return self.getStat(index)
             prop = self.properties[index.row()]
             if index.column():
                 attr = getattr(self.obj.Proxy.Serial, prop)
@@ -144,3 +166,11 @@ class PySerialModel(PySerialBaseModel):
             color = QtGui.QColor("#f0f0f0") if index.row() % 2 == 0 else QtCore.Qt.white
             return QtGui.QBrush(color)
         return None
+
+    def getStat(self, index):
+        stat = self.stats[index.row() - len(self.properties)]
+        if not index.column():
+            return stat
+        if stat == "Latency":
+            return ", ".join(self.obj.Proxy.Stats.getLatency())
+        return "{}".format(getattr(self.obj.Proxy.Stats, stat))
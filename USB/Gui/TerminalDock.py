@@ -24,7 +24,9 @@
 """ GUI Terminal Dock object """
 from __future__ import unicode_literals
 
+import re
 from PySide import QtCore, QtGui
+from App import SessionIndex, SessionLog
 
 
 class TextEditWidget(QtGui.QPlainTextEdit):
@@ -108,10 +110,19 @@ class TerminalDock(QtGui.QDockWidget):
         self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
         self.stop = True
         self.state = state
+        """ Output received since last flush, appended at most once per frame """
+        self.buffer = []
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(40)
+        self.timer.timeout.connect(self.flush)
         obj = state.machine().obj
         self.setWindowTitle("{} terminal on {}".format(obj.Label, state.obj.Label))
         self.setObjectName("{}-{}".format(obj.Document.Name, obj.Name))
-        state.serialRead.connect(self.on_output)
+        # Terminal line number of the next line received, read with the connection
+        with state.lock:
+            state.serialRead.connect(self.on_output)
+            self.shown = state.shown
         state.machine().finished.connect(self.finished)
         if obj.ViewObject.DualView:
             terminal = QtGui.QSplitter(QtCore.Qt.Vertical)
@@ -119,6 +130,7 @@ class TerminalDock(QtGui.QDockWidget):
             terminal.addWidget(self.output)
             textedit = TextEditWidget()
             textedit.command.connect(state.serialWrite)
+            textedit.command.connect(self.on_command)
             terminal.addWidget(textedit)
         else:
             terminal = QtGui.QWidget(self)
@@ -126,13 +138,157 @@ class TerminalDock(QtGui.QDockWidget):
             terminal.layout().setContentsMargins(0, 0, 0, 0)
             self.output = TextEditWidget()
             self.output.command.connect(state.serialWrite)
+            self.output.command.connect(self.on_command)
             terminal.layout().addWidget(self.output)
-        self.setWidget(terminal)
+        # Oldest lines are dropped: append cost does not grow with the session
+        scrollback = getattr(obj.ViewObject, "Scrollback", 10000)
+        self.output.setMaximumBlockCount(scrollback)
+        # Lines are indexed only while the terminal is open, about its scrollback
+        state.openIndex(scrollback)
+        self.index = state.index
+        """ Line number in state index of the current match, None if not searching """
+        self.match = None
+        self.search = QtGui.QLineEdit()
+        self.search.setPlaceholderText("Search: JSON key, G/M code or regex")
+        self.search.returnPressed.connect(self.on_previous)
+        self.search.textChanged.connect(self.on_query)
+        previous = QtGui.QToolButton()
+        previous.setArrowType(QtCore.Qt.UpArrow)
+        previous.clicked.connect(self.on_previous)
+        following = QtGui.QToolButton()
+        following.setArrowType(QtCore.Qt.DownArrow)
+        following.clicked.connect(self.on_next)
+        self.found = QtGui.QLabel()
+        search = QtGui.QHBoxLayout()
+        search.addWidget(self.search)
+        search.addWidget(previous)
+        search.addWidget(following)
+        widget = QtGui.QWidget(self)
+        widget.setLayout(QtGui.QVBoxLayout())
+        widget.layout().setContentsMargins(0, 0, 0, 0)
+        widget.layout().addLayout(search)
+        widget.layout().addWidget(self.found)
+        widget.layout().addWidget(terminal)
+        self.setWidget(widget)
 
     @QtCore.Slot(unicode)
     def on_output(self, data):
-        self.output.insertPlainText(data)
-        self.output.ensureCursorVisible()
+        self.buffer.append((self.shown, data))
+        self.shown += 1
+        if not self.timer.isActive():
+            self.timer.start()
+
+    @QtCore.Slot(unicode)
+    def on_command(self, command):
+        # Response to a typed command pass the echo filter
+        if self.state.machine().filter is not None:
+            self.state.machine().filter.expect(command)
+
+    @QtCore.Slot()
+    def flush(self):
+        if not self.buffer:
+            return
+        buffer = self.buffer
+        self.buffer = []
+        # Each block keeps the terminal line number of its line as user state
+        cursor = QtGui.QTextCursor(self.output.document())
+        cursor.movePosition(QtGui.QTextCursor.End)
+        cursor.beginEditBlock()
+        for shown, data in buffer:
+            block = cursor.block()
+            cursor.insertText(data)
+            if block.userState() < 0:
+                block.setUserState(shown)
+        cursor.endEditBlock()
+        # Not scrolled while a match is shown
+        if self.match is None:
+            self.output.moveCursor(QtGui.QTextCursor.End)
+            self.output.ensureCursorVisible()
+
+    @QtCore.Slot(unicode)
+    def on_query(self, query):
+        self.match = None
+        self.found.clear()
+        if not query:
+            self.output.moveCursor(QtGui.QTextCursor.End)
+
+    @QtCore.Slot()
+    def on_previous(self):
+        self.find(True)
+
+    @QtCore.Slot()
+    def on_next(self):
+        self.find(False)
+
+    def find(self, backward):
+        query = self.search.text()
+        if not query:
+            return
+        index = self.state.index
+        if index is None:
+            return
+        try:
+            if backward:
+                n = index.findPrevious(query, self.match)
+            else:
+                n = index.findNext(query, -1 if self.match is None else self.match)
+        except re.error as e:
+            self.found.setText("Invalid query: {}".format(e))
+            return
+        if n is None:
+            self.found.setText("No match")
+            return
+        self.match = n
+        line = index.getLine(n)
+        if line is None:
+            self.found.setText("No match")
+            return
+        block = self.findBlock(index.getShown(n))
+        if block is not None:
+            cursor = QtGui.QTextCursor(block)
+            cursor.movePosition(QtGui.QTextCursor.EndOfBlock, QtGui.QTextCursor.KeepAnchor)
+            self.output.setTextCursor(cursor)
+            self.output.ensureCursorVisible()
+            self.found.setText("Line {}".format(n + 1))
+            return
+        # Filtered or dropped from scrollback: located in the session log
+        obj = self.state.obj
+        if getattr(obj, "Log", False):
+            path = SessionLog.getPath(obj.Proxy.getLogChannel(obj))
+            found = SessionIndex.findInLog(path, line, index.getRepeats(n))
+            if found is not None:
+                msg = "Line {} not in scrollback, approximately at {}:{}"
+                self.found.setText(msg.format(n + 1, *found))
+                return
+        self.found.setText("Line {} not in scrollback: {}".format(n + 1, line))
+
+    def findBlock(self, shown):
+        """ Block of terminal line number shown, None if filtered or dropped """
+        if shown < 0:
+            return None
+        document = self.output.document()
+        lo, hi = 0, document.blockCount()
+        while lo < hi:
+            mid = (lo + hi) // 2
+            block = self.getStateBlock(document.findBlockByNumber(mid))
+            if not block.isValid() or block.userState() >= shown:
+                hi = mid
+            else:
+                lo = block.blockNumber() + 1
+        block = self.getStateBlock(document.findBlockByNumber(lo))
+        return block if block.isValid() and block.userState() == shown else None
+
+    def getStateBlock(self, block):
+        # Typed commands have no terminal line number
+        while block.isValid() and block.userState() < 0:
+            block = block.next()
+        return block
+
+    def setScrollback(self, scrollback):
+        self.output.setMaximumBlockCount(scrollback)
+        index = self.state.index
+        if index is not None:
+            index.limit = scrollback
 
     @QtCore.Slot()    
     def finished(self):
@@ -140,5 +296,7 @@ class TerminalDock(QtGui.QDockWidget):
         self.close()
 
     def closeEvent(self, e):
+        if self.state.index is self.index:
+            self.state.closeIndex()
         if self.stop and self.state.machine().isRunning():
             self.state.machine().stop()
@@ -24,11 +24,89 @@
 """ TinyG2 ViewProvider Plugin object """
 from __future__ import unicode_literals
 
-import FreeCADGui
+import FreeCAD, FreeCADGui, os
+from array import array
+from App import TinyG2Positions, TinyG2Preview, TinyG2Deviation, TinyG2Machine
 from Gui import UsbPoolGui, TinyG2Panel, TinyG2Model
 from pivy import coin
 
 
+""" Screen area (pixels) above which each finer level is drawn """
+LEVELS = (640000, 40000)
+""" Positions decimated at once for the coarse levels """
+CHUNK = 4096
+
+
+class PathLevel:
+
+    def __init__(self, tolerance=0.0):
+        self.coords = coin.SoCoordinate3()
+        self.lines = coin.SoLineSet()
+        self.lines.numVertices.setValue(0)
+        self.node = coin.SoSeparator()
+        self.node.addChild(self.coords)
+        self.node.addChild(self.lines)
+        """ Decimation tolerance relative to path size, 0 for full detail """
+        self.tolerance = tolerance
+        self.capacity = 0
+        self.count = 0
+        self.done = 0
+        """ Store index of the decimated vertices, per vertex colors if any """
+        self.indices = array(b"l")
+        self.colors = None
+        self.binding = None
+
+    def write(self, index, points):
+        """ Write points from index, the line ends after them """
+        count = index + len(points)
+        if count > self.capacity:
+            # Capacity doubling: unused points are ignored by numVertices
+            while self.capacity < count:
+                self.capacity = max(1024, 2 * self.capacity)
+            self.coords.point.setNum(self.capacity)
+        if points:
+            self.coords.point.setValues(index, len(points), points)
+        self.lines.numVertices.set1Value(0, count)
+
+    def update(self, store, count, size):
+        """ Decimate the complete chunks, the tail is drawn as is """
+        while count - self.done >= CHUNK:
+            first = max(0, self.done - 1)
+            stop = self.done + CHUNK
+            coords = store.getCoords(first, stop)
+            keep = TinyG2Positions.simplify(coords, self.tolerance * size)
+            if self.done:
+                keep = keep[1:]
+            points = [tuple(coords[k]) for k in keep]
+            self.indices.extend(first + k for k in keep)
+            self.write(self.count, points)
+            self.count += len(points)
+            self.done = stop
+        self.write(self.count, store.getPoints(self.done, count))
+
+    def setColors(self, colors, count):
+        """ Per vertex colors from the colors of the store positions """
+        if self.tolerance:
+            vertices = self.indices.tolist() + range(self.done, count)
+        else:
+            vertices = range(count)
+        rgb = [colors[i] for i in vertices]
+        if self.colors is None:
+            self.colors = coin.SoBaseColor()
+            self.binding = coin.SoMaterialBinding()
+            self.binding.value = coin.SoMaterialBinding.PER_VERTEX
+            self.node.insertChild(self.binding, 0)
+            self.node.insertChild(self.colors, 0)
+        self.colors.rgb.setValues(0, len(rgb), rgb)
+
+    def clearColors(self):
+        if self.colors is not None:
+            self.node.removeChild(self.colors)
+            self.node.removeChild(self.binding)
+        self.colors = None
+        self.binding = None
+
+
 class _ViewProviderPool(UsbPoolGui._ViewProviderPool):
 
     def __init__(self, vobj): #mandatory
@@ -36,7 +114,8 @@ class _ViewProviderPool(UsbPoolGui._ViewProviderPool):
         self.Type = "Gui::UsbTinyG2"
         for p in vobj.PropertiesList:
             if vobj.getGroupOfProperty(p) in ["Drawing", "Terminal"]:
-                if p not in ["Buffers", "Color", "Draw", "Positions", "DualView", "EchoFilter"]:
+                if p not in ["Buffers", "Color", "Draw", "Positions", "Preview", "DualView", "Scrollback", "EchoFilter",
+                              "EchoKeys", "EchoPatterns"]:
                     vobj.removeProperty(p)
         if "Buffers" not in vobj.PropertiesList:
             vobj.addProperty("App::PropertyInteger",
@@ -61,47 +140,237 @@ class _ViewProviderPool(UsbPoolGui._ViewProviderPool):
                              "Positions",
                              "Drawing",
                              "List of positions acquired during upload")
-            vobj.Positions = []
+        if not isinstance(vobj.Positions, TinyG2Positions.PositionStore):
+            vobj.Positions = vobj.Object.Proxy.Machine.positions
+        if "Preview" not in vobj.PropertiesList:
+            vobj.addProperty("App::PropertyBool",
+                             "Preview",
+                             "Drawing",
+                             "Preview the upload file toolpath")
+            vobj.Preview = False
         if "DualView" not in vobj.PropertiesList:
             vobj.addProperty("App::PropertyBool",
                              "DualView",
                              "Terminal",
                              "Enable/disable terminal dualview")
             vobj.DualView = False
+        if "Scrollback" not in vobj.PropertiesList:
+            vobj.addProperty("App::PropertyInteger",
+                             "Scrollback",
+                             "Terminal",
+                             "Maximum number of lines kept in terminal")
+            vobj.Scrollback = 10000
         if "EchoFilter" not in vobj.PropertiesList:
             vobj.addProperty("App::PropertyBool",
                              "EchoFilter",
                              "Terminal",
                              "Filter terminal echo during upload")
             vobj.EchoFilter = True
+        if "EchoKeys" not in vobj.PropertiesList:
+            vobj.addProperty("App::PropertyStringList",
+                             "EchoKeys",
+                             "Terminal",
+                             "JSON keys of the lines filtered (line made only of these keys)")
+            vobj.EchoKeys = TinyG2Machine.ECHO_KEYS
+        if "EchoPatterns" not in vobj.PropertiesList:
+            vobj.addProperty("App::PropertyStringList",
+                             "EchoPatterns",
+                             "Terminal",
+                             "Regex of the text lines filtered")
+            vobj.EchoPatterns = TinyG2Machine.ECHO_PATTERNS
         self.Object = vobj.Object
+        self.path = None
+        self.preview = None
+        self.indexPosition = 0
+        self.generation = None
+        """ Deviation analysis running, one at a time """
+        self.analysis = None
         vobj.Proxy = self
+        self.Model.status.setVisible("drawing", vobj.Draw and vobj.Visibility)
+        self.setEchoFilter(vobj)
 
     def attach(self, vobj):
         self.Model = TinyG2Model.PoolModel(vobj.Object)
         self.Type = "Gui::UsbTinyG2"
         self.Object = vobj.Object
+        self.path = None
+        self.preview = None
+        self.indexPosition = 0
+        self.generation = None
+        self.analysis = None
+        self.Model.status.setVisible("drawing", vobj.Draw and vobj.Visibility)
+        self.setEchoFilter(vobj)
+
+    def setEchoFilter(self, vobj):
+        # Documents saved before EchoKeys and EchoPatterns keep the defaults
+        f = vobj.Object.Proxy.Machine.filter
+        f.enabled = vobj.EchoFilter
+        f.setKeys(getattr(vobj, "EchoKeys", TinyG2Machine.ECHO_KEYS))
+        f.setPatterns(getattr(vobj, "EchoPatterns", TinyG2Machine.ECHO_PATTERNS))
 
     def onChanged(self, vobj, prop):
-        if prop == "Positions":
-            if not vobj.Draw:
+        if prop == "Scrollback":
+            UsbPoolGui.setScrollback(vobj)
+        if prop in ["EchoFilter", "EchoKeys", "EchoPatterns"] and hasattr(self, "Model"):
+            self.setEchoFilter(vobj)
+        if prop == "Preview" and hasattr(self, "Model"):
+            self.updatePreview(vobj)
+        if prop in ["Draw", "Visibility"] and hasattr(self, "Model"):
+            self.Model.status.setVisible("drawing", vobj.Draw and vobj.Visibility)
+        if prop == "Draw" and not vobj.Draw:
+            self.removePath(vobj)
+        if prop == "Color" and getattr(self, "path", None) is not None:
+            self.path[1].rgb = vobj.Color[0:3]
+        if prop in ["Positions", "Draw", "Visibility"]:
+            store = vobj.Positions
+            if type(store) is list and store:
+                vobj.Positions = TinyG2Positions.fromPoints(store)
                 return
-            if vobj.Proxy.indexPosition:
-                po = list(vobj.Positions[vobj.Proxy.indexPosition-1:])
-            else:
-                po = list(vobj.Positions[vobj.Proxy.indexPosition:])
-            vobj.Proxy.indexPosition = len(vobj.Positions)
-            co = coin.SoCoordinate3()
-            co.point.setValues(0, len(po), po)
+            if not isinstance(store, TinyG2Positions.PositionStore):
+                return
+            # Restored store: the reader thread keeps appending to it
+            machine = getattr(getattr(vobj.Object, "Proxy", None), "Machine", None)
+            if machine is not None and machine.positions is not store:
+                machine.positions = store
+            # Saved positions are only decoded once the path is shown
+            if vobj.Draw and vobj.Visibility:
+                self.drawPositions(vobj, store)
+
+    def updateData(self, obj, prop):
+        UsbPoolGui._ViewProviderPool.updateData(self, obj, prop)
+        if prop == "UploadFile" and getattr(obj.ViewObject, "Preview", False):
+            self.updatePreview(obj.ViewObject)
+
+    def updatePreview(self, vobj):
+        """ Upload file toolpath: one line set, a polyline per run of rapids or feeds """
+        if getattr(self, "preview", None) is not None:
+            vobj.RootNode.removeChild(self.preview)
+        self.preview = None
+        path = vobj.Object.UploadFile
+        if not vobj.Preview or not os.path.isfile(path):
+            return
+        try:
+            toolpath = TinyG2Preview.parse(path)
+        except (IOError, ValueError) as e:
+            self.previewErrorMsg(path, e)
+            return
+        coords, lengths, rapids = TinyG2Preview.interpolate(toolpath)
+        if not lengths:
+            return
+        co = coin.SoCoordinate3()
+        co.point.setValues(0, len(coords), coords.tolist() if hasattr(coords, "tolist") else coords)
+        ma = coin.SoBaseColor()
+        ma.rgb.setValues(0, len(rapids), [(0.5, 0.5, 0.5) if r else (0.0, 0.5, 1.0) for r in rapids])
+        mb = coin.SoMaterialBinding()
+        mb.value = coin.SoMaterialBinding.PER_PART
+        li = coin.SoLineSet()
+        li.numVertices.setValues(0, len(lengths), lengths)
+        no = coin.SoSeparator()
+        no.addChild(co)
+        no.addChild(ma)
+        no.addChild(mb)
+        no.addChild(li)
+        vobj.RootNode.addChild(no)
+        self.preview = no
+
+    def previewErrorMsg(self, path, e):
+        msg = "Error occurred while reading upload file {}: {}\n"
+        FreeCAD.Console.PrintError(msg.format(path, e))
+
+    def getPath(self, vobj):
+        """ Single path node of the job, growing in place """
+        if getattr(self, "path", None) is None:
             ma = coin.SoBaseColor()
             ma.rgb = vobj.Color[0:3]
-            li = coin.SoLineSet()
-            li.numVertices.setValue(len(po))
+            # Full detail, then decimated at one pixel for each level area
+            levels = [PathLevel()] + [PathLevel(a ** -0.5) for a in LEVELS]
+            lod = coin.SoLevelOfDetail()
+            lod.screenArea.setValues(0, len(LEVELS), LEVELS)
+            for level in levels:
+                lod.addChild(level.node)
             no = coin.SoSeparator()
-            no.addChild(co)
             no.addChild(ma)
-            no.addChild(li)
+            no.addChild(lod)
             vobj.RootNode.addChild(no)
+            self.path = (no, ma, levels)
+            self.bounds = None
+            self.indexPosition = 0
+        return self.path
+
+    def removePath(self, vobj):
+        if getattr(self, "path", None) is not None:
+            vobj.RootNode.removeChild(self.path[0])
+        self.path = None
+
+    def drawPositions(self, vobj, store):
+        generation = store.generation
+        count = len(store)
+        if generation != self.generation or count < self.indexPosition:
+            # Store cleared: new job
+            self.removePath(vobj)
+            self.generation = generation
+        no, ma, levels = self.getPath(vobj)
+        points = store.getPoints(self.indexPosition, count)
+        if not points:
+            return
+        levels[0].write(self.indexPosition, points)
+        self.indexPosition = count
+        self.updateBounds(points)
+        size = max(b - a for a, b in zip(*self.bounds))
+        for level in levels[1:]:
+            level.update(store, count, size)
+        for level in levels:
+            level.clearColors()
+
+    def startDeviation(self, vobj, finished=None):
+        """ Analyse the deviation from the upload file in a worker thread, None if not started """
+        store = vobj.Positions
+        if not isinstance(store, TinyG2Positions.PositionStore):
+            return None
+        if self.analysis is not None:
+            return None
+        self.analysis = TinyG2Deviation.start(vobj.Object.UploadFile, store, self.showDeviation)
+        if finished is not None:
+            self.analysis.finished.connect(finished)
+        return self.analysis
+
+    def showDeviation(self, result):
+        """ Color the drawn path by deviation, called in GUI thread when analysed """
+        analysis, self.analysis = self.analysis, None
+        if isinstance(result, Exception):
+            self.deviationErrorMsg(result)
+            return
+        distances, colors, statistics = result
+        if not statistics["count"]:
+            return
+        self.deviationMsg(statistics)
+        vobj = self.Object.ViewObject
+        store = analysis.store
+        # Store cleared or replaced meanwhile: the colors are from another path
+        if not (vobj.Draw and vobj.Visibility) or vobj.Positions is not store or\
+           store.generation != analysis.generation:
+            return
+        self.drawPositions(vobj, store)
+        # Positions received since the analysis keep the path color
+        colors += [tuple(vobj.Color[0:3])] * (self.indexPosition - analysis.count)
+        for level in self.path[2]:
+            level.setColors(colors, self.indexPosition)
+
+    def deviationMsg(self, statistics):
+        msg = "{} deviation on {count} positions: max {max:.4f}, mean {mean:.4f}, p50 {p50:.4f}, p95 {p95:.4f}, p99 {p99:.4f}\n"
+        FreeCAD.Console.PrintMessage(msg.format(self.Object.Label, **statistics))
+
+    def deviationErrorMsg(self, e):
+        msg = "Error occurred in deviation analysis: {}\n"
+        FreeCAD.Console.PrintError(msg.format(e))
+
+    def updateBounds(self, points):
+        low = [min(p[i] for p in points) for i in range(3)]
+        high = [max(p[i] for p in points) for i in range(3)]
+        if self.bounds is not None:
+            low = [min(a, b) for a, b in zip(low, self.bounds[0])]
+            high = [max(a, b) for a, b in zip(high, self.bounds[1])]
+        self.bounds = (low, high)
 
     def setEdit(self, vobj, mode=0):
         # this is executed when the object is double-clicked in the tree
@@ -25,24 +25,27 @@
 from __future__ import unicode_literals
 
 from PySide import QtCore, QtGui
+from App import TinyG2Decoder, TinyG2Snapshot, TinyG2Profile, TinyG2Status
 import json
 import copy
 
 
 class Node(object):
 
+    __slots__ = ("key", "child", "parent", "_row")
+
     def __init__(self, parent, key):
         self.key = key
         self.child = []
         self.parent = parent
+        self._row = None
         if parent is not None:
+            # Tree never change: row is known at creation
+            self._row = len(parent.child)
             parent.child.append(self)
 
     def row(self):
-        if self.parent is None:
-            return None
-        else:
-            return self.parent.child.index(self)
+        return self._row
 
     def log(self, level=0):
         output = ""
@@ -56,12 +59,13 @@ class Node(object):
     def __repr__(self):
         return self.log()
 
-def makeTree(parent, child):
+def makeTree(parent, child, nodes):
     for value in child:
         if type(value) is not list:
             node = Node(parent, value)
+            nodes[value] = node
         else:
-            makeTree(node, value)
+            makeTree(node, value, nodes)
 
 def makeData(data, tree, header):
     data[tree.key] = [None] * len(header)
@@ -83,6 +87,14 @@ class PoolBaseModel(QtCore.QAbstractItemModel):
 
     title = QtCore.Signal(unicode)
     rootIndex = QtCore.Signal(QtCore.QModelIndex)
+    nline = QtCore.Signal(unicode)
+    buffers = QtCore.Signal(unicode)
+    posx = QtCore.Signal(unicode)
+    posy = QtCore.Signal(unicode)
+    posz = QtCore.Signal(unicode)
+    vel = QtCore.Signal(unicode)
+    feed = QtCore.Signal(unicode)
+    stat = QtCore.Signal(unicode)
 
     def __init__(self):
         QtCore.QAbstractItemModel.__init__(self)
@@ -93,56 +105,11 @@ class PoolBaseModel(QtCore.QAbstractItemModel):
         self.setRoleNames({QtCore.Qt.UserRole + 1: b"command"})
         self.initcmd = ['{"unit":n}','{"o":n}','{"sys":n}','{"p1":n}',
                         '{"q":n}','{"m":n}','{"r":n}', '$$']
+        """ Keys checked against snapshot and keys always read on reconnect """
+        self.fingerprint = ["fb", "fv", "unit"]
+        self.volatile = ['{"o":n}']
 
-        self.dickey = {"r":{"unit":"unit",
-                            "g54":{"x":"g54x","y":"g54y","z":"g54z","a":"g54a","b":"g54b","c":"g54c"},
-                            "g55":{"x":"g55x","y":"g55y","z":"g55z","a":"g55a","b":"g55b","c":"g55c"},
-                            "g56":{"x":"g56x","y":"g56y","z":"g56z","a":"g56a","b":"g56b","c":"g56c"},
-                            "g57":{"x":"g57x","y":"g57y","z":"g57z","a":"g57a","b":"g57b","c":"g57c"},
-                            "g58":{"x":"g58x","y":"g58y","z":"g58z","a":"g58a","b":"g58b","c":"g58c"},
-                            "g59":{"x":"g59x","y":"g59y","z":"g59z","a":"g59a","b":"g59b","c":"g59c"},
-                            "g92":{"x":"g92x","y":"g92y","z":"g92z","a":"g92a","b":"g92b","c":"g92c"},
-                            "g28":{"x":"g28x","y":"g28y","z":"g28z","a":"g28a","b":"g28b","c":"g28c"},
-                            "g30":{"x":"g30x","y":"g30y","z":"g30z","a":"g30a","b":"g30b","c":"g30c"},
-                            "sys":{"fb":"fb","fbs":"fbs","fv":"fv","cv":"cv","hp":"hp",
-                                   "hv":"hv","id":"id","ja":"ja","ct":"ct","sl":"sl",
-                                   "lim":"lim","saf":"saf","mt":"mt","m48e":"m48e","mfoe":"mfoe",
-                                   "mfo":"mfo","spep":"spep","spdp":"spdp","spph":"spph","spdw":"spdw",
-                                   "cofp":"cofp","comp":"comp","coph":"coph","tv":"tv","ej":"ej",
-                                   "jv":"jv","js":"js","qv":"qv","sv":"sv","si":"si",
-                                   "gpl":"gpl","gun":"gun","gco":"gco","gpa":"gpa","gdi":"gdi"},
-                            "p1":{"frq":"p1frq","csl":"p1csl","csh":"p1csh","cpl":"p1cpl","cph":"p1cph",
-                                  "wsl":"p1wsl","wsh":"p1wsh","wpl":"p1wpl","wph":"p1wph","pof":"p1pof"},
-                            "x":{"am":"xam","vm":"xvm","fr":"xfr","tn":"xtn","tm":"xtm",
-                                 "jm":"xjm","jh":"xjh","jd":"xjd","hi":"xhi","hd":"xhd",
-                                 "sv":"xsv","lv":"xlv","lb":"xlb","zb":"xzb"},
-                            "y":{"am":"yam","vm":"yvm","fr":"yfr","tn":"ytn","tm":"ytm",
-                                 "jm":"yjm","jh":"yjh","jd":"yjd","hi":"yhi","hd":"yhd",
-                                 "sv":"ysv","lv":"ylv","lb":"ylb","zb":"yzb"},
-                            "z":{"am":"zam","vm":"zvm","fr":"zfr","tn":"ztn","tm":"ztm",
-                                 "jm":"zjm","jh":"zjh","jd":"zjd","hi":"zhi","hd":"zhd",
-                                 "sv":"zsv","lv":"zlv","lb":"zlb","zb":"zzb"},
-                            "a":{"am":"aam","vm":"avm","fr":"afr","tn":"atn","tm":"atm",
-                                 "jm":"ajm","jh":"ajh","jd":"ajd","ra":"ara","hi":"ahi",
-                                 "hd":"ahd","sv":"asv","lv":"alv","lb":"alb","zb":"azb"},
-                            "b":{"am":"bam","vm":"bvm","fr":"bfr","tn":"btn","tm":"btm",
-                                 "jm":"bjm","jh":"bjh","jd":"bjd","ra":"bra","hi":"bhi",
-                                 "hd":"bhd","sv":"bsv","lv":"blv","lb":"blb","zb":"bzb"},
-                            "c":{"am":"cam","vm":"cvm","fr":"cfr","tn":"ctn","tm":"ctm",
-                                 "jm":"cjm","jh":"cjh","jd":"cjd","ra":"cra","hi":"chi",
-                                 "hd":"chd","sv":"csv","lv":"clv","lb":"clb","zb":"czb"},
-                            "1":{"ma":"1ma","sa":"1sa","tr":"1tr","mi":"1mi","po":"1po",
-                                 "pm":"1pm","pl":"1pl"},
-                            "2":{"ma":"2ma","sa":"2sa","tr":"2tr","mi":"2mi","po":"2po",
-                                 "pm":"2pm","pl":"2pl"},
-                            "3":{"ma":"3ma","sa":"3sa","tr":"3tr","mi":"3mi","po":"3po",
-                                 "pm":"3pm","pl":"3pl"},
-                            "4":{"ma":"4ma","sa":"4sa","tr":"4tr","mi":"4mi","po":"4po",
-                                 "pm":"4pm","pl":"4pl"},
-                            "5":{"ma":"5ma","sa":"5sa","tr":"5tr","mi":"5mi","po":"5po",
-                                 "pm":"5pm","pl":"5pl"},
-                            "6":{"ma":"6ma","sa":"6sa","tr":"6tr","mi":"6mi","po":"6po",
-                                 "pm":"6pm","pl":"6pl"}}}
+        self.dickey = TinyG2Decoder.DICKEY
 
         treekey = ["o",["g54",["g54x","g54y","g54z","g54a","g54b","g54c"],
                         "g55",["g55x","g55y","g55z","g55a","g55b","g55c"],
@@ -179,19 +146,24 @@ class PoolBaseModel(QtCore.QAbstractItemModel):
                         "6",["6ma","6sa","6tr","6mi","6po","6pm","6pl"]],
                    "unit"]
         self.treeKey = Node(None, "r")
-        makeTree(self.treeKey, treekey)
+        self.nodeKey = {}
+        makeTree(self.treeKey, treekey, self.nodeKey)
         self.dataKey = {}
         makeData(self.dataKey, self.treeKey, self._header)
         self.dataKey["unit"][self._header.index("Value")] = unit
         self.cmdKey = {}
         makeCmd(self.cmdKey, self.dickey["r"], ["r"])
+        """ Tree is static: index of each key can be cached """
+        self.indexKey = {}
+        for key, node in self.nodeKey.iteritems():
+            self.indexKey[key] = self.createIndex(node.row(), 0, node)
 
     def parent(self, index=QtCore.QModelIndex()):
         node = index.internalPointer()
         if node.parent is None:
             return QtCore.QModelIndex()
         parentnode = node.parent
-        if parentnode == self.treeKey:
+        if parentnode is self.treeKey:
             return QtCore.QModelIndex()
         return self.createIndex(parentnode.row(), 0, parentnode)
 
@@ -268,56 +240,143 @@ class PoolModel(PoolBaseModel):
     def __init__(self, obj):
         PoolBaseModel.__init__(self)
         self.obj = obj
+        """ Keys changed since last dataChanged emission """
+        self.dirty = set()
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(50)
+        self.timer.timeout.connect(self.onDataChanged)
+        """ Fingerprint values expected from the snapshot """
+        self.pending = {}
+        self.device = None
+        self.status = TinyG2Status.StatusManager(obj)
+        """ Positions of the machine store already handed to the view """
+        self.flushed = 0
+        self.generation = 0
         obj.Proxy.Machine.ctrlStart.connect(self.onCtrlStart)
-        obj.Proxy.Machine.serialRead.connect(self.onSerialRead)
+        obj.Proxy.Machine.ctrlStop.connect(self.onCtrlStop)
+        obj.Proxy.Machine.serialData.connect(self.onSerialData)
 
-    @QtCore.Slot()    
+    @QtCore.Slot()
     def onCtrlStart(self):
+        self.pending = {}
+        self.device = self.obj.Id
+        snapshot = TinyG2Snapshot.Snapshots.get(self.device)
+        if snapshot is None:
+            self.refresh()
+            return
+        # Fill from cache, full dump only if fingerprint differ
+        for key, values in snapshot.iteritems():
+            for column, value in enumerate(values, 1):
+                self.setDataColumn(key, column, value)
+        value = self._header.index("Value")
+        self.pending = dict((k, snapshot[k][value - 1]) for k in self.fingerprint
+                            if snapshot.has_key(k))
+        self.title.emit("Checking configuration...")
+        eol = self.obj.Proxy.getCharEndOfLine(self.obj)
+        cmd = ['{{"{}":n}}'.format(k) for k in self.fingerprint] + self.volatile
+        self.obj.Proxy.Machine.serialWrite(eol.join(cmd))
+
+    @QtCore.Slot()
+    def onCtrlStop(self):
+        self.pending = {}
+        if self.isComplete():
+            snapshot = dict((k, v[1:]) for k, v in self.dataKey.iteritems()
+                            if self.nodeKey.has_key(k))
+            TinyG2Snapshot.Snapshots.set(self.device, snapshot)
+
+    def refresh(self):
+        self.pending = {}
         self.title.emit("Initialisation in progress...")
         eol = self.obj.Proxy.getCharEndOfLine(self.obj)
-        self.obj.Proxy.Machine.serialWrite(eol.join(self.initcmd))      
-        
-    @QtCore.Slot(unicode)    
-    def onSerialRead(self, data):
-        try:
-            d = json.loads(data)
-        except ValueError:
-            self.onDataTxt(data)
-        else:
-            if d.has_key("r"):
-                self.getDataDic(self.dickey["r"], d["r"])
+        self.obj.Proxy.Machine.serialWrite(eol.join(self.initcmd))
+
+    def isComplete(self):
+        value = self._header.index("Value")
+        description = self._header.index("Description")
+        for key, node in self.nodeKey.iteritems():
+            if node.child:
+                continue
+            if self.dataKey[key][value] is None or self.dataKey[key][description] is None:
+                return False
+        return True
 
-    def onDataTxt(self, txt):
-        if not txt or "]" not in txt:
-            return
-        i = txt.index("]")
-        key = txt[1:i]
+
+    @QtCore.Slot(object)
+    def onSerialData(self, updates):
+        # Lines are decoded by the reader thread: only store here
+        for key, column, value in updates:
+            if key == "sr":
+                self.report(value)
+            elif key == "qr":
+                self.buffers.emit("{}".format(value))
+            else:
+                self.setDataColumn(key, column, value)
+
+    def setDataColumn(self, key, column, value):
         if not self.dataKey.has_key(key):
             return
-        value = txt[i+1:]
-        values = value.split("  ")
-        if len(values)>1:
-            description = values[0].strip()
-            unit = values[-1].strip()
-        else:
-            i = min(value.index("0"), value.index("1"))
-            description = value[:i].strip()
-            unit = value[i:].strip()
-        self.setDataKey(key, description, "Description")
-        self.setDataKey(key, unit, ("Unit (inches)", "Unit (mm)"))
-
-    def getDataDic(self, dickey, data):
-        if type(data) is dict:
-            for k, value in data.iteritems():
-                if type(dickey) is dict and dickey.has_key(k):
-                    self.getDataDic(dickey[k], value)
-        else:
-            self.setDataKey(dickey, data, "Value")
+        self.dataKey[key][column] = value
+        self.dirty.add(key)
+        if not self.timer.isActive():
+            self.timer.start()
+        if column == self._header.index("Value") and self.pending.has_key(key):
+            self.checkFingerprint(key, value)
+
+    def checkFingerprint(self, key, value):
+        if self.pending.pop(key) != value:
+            self.refresh()
+        elif not self.pending:
+            self.title.emit("Configuration loaded from cache")
+
+    @QtCore.Slot()
+    def onDataChanged(self):
+        # One dataChanged per parent for all the rows changed in the batch
+        rows = {}
+        for key in self.dirty:
+            node = self.nodeKey.get(key)
+            if node is not None:
+                rows.setdefault(node.parent, []).append(node.row())
+        last = len(self._header) - 1
+        if "unit" in self.dirty:
+            self.headerDataChanged.emit(QtCore.Qt.Horizontal, last, last)
+        self.dirty = set()
+        for parent, r in rows.iteritems():
+            top, bottom = min(r), max(r)
+            self.dataChanged.emit(self.createIndex(top, 0, parent.child[top]),
+                                  self.createIndex(bottom, last, parent.child[bottom]))
 
     def setDataKey(self, key, value, header):
-        if not self.dataKey.has_key(key):
-            return
-        self.dataKey[key][self._header.index(header)] = value
+        self.setDataColumn(key, self._header.index(header), value)
+
+    def getValues(self):
+        value = self._header.index("Value")
+        return dict((k, v[value]) for k, v in self.dataKey.iteritems() if v[value] is not None)
+
+    def getProfile(self):
+        return TinyG2Profile.makeProfile(self.getValues())
+
+    def applyProfile(self, profile):
+        if not self.obj.Proxy.Machine.isRunning():
+            return None
+        if self.obj.Proxy.Machine.busy:
+            self.title.emit("Profile not applied: job in progress")
+            return None
+        values = self.getValues()
+        # Axis values are not converted: the profile unit must be the controller unit
+        error = TinyG2Profile.getUnitError(profile, values)
+        if error is not None:
+            self.title.emit("Profile not applied: {}".format(error))
+            return None
+        self.title.emit("Applying profile...")
+        return TinyG2Profile.apply(self.obj, profile, values, self.onProfileApplied)
+
+    @QtCore.Slot(bool)
+    def onProfileApplied(self, verified):
+        if verified:
+            self.title.emit("Profile applied and verified")
+        else:
+            self.title.emit("Profile applied with errors")
 
     @QtCore.Slot()
     def onInches(self):
@@ -325,7 +384,7 @@ class PoolModel(PoolBaseModel):
             return
         if self.obj.Proxy.Machine.isRunning():
             self.obj.Proxy.Machine.serialWrite('G20')
-            self.onCtrlStart()
+            self.refresh()
 
     @QtCore.Slot()
     def onMetric(self):
@@ -333,7 +392,7 @@ class PoolModel(PoolBaseModel):
             return
         if self.obj.Proxy.Machine.isRunning():
             self.obj.Proxy.Machine.serialWrite('G21')
-            self.onCtrlStart()
+            self.refresh()
 
     @QtCore.Slot(QtCore.QPoint, int)
     def onUnit(self, pos, index):
@@ -348,11 +407,7 @@ class PoolModel(PoolBaseModel):
 
     @QtCore.Slot(unicode)
     def setRootIndex(self, key):
-        index = QtCore.QModelIndex()
-        flag = QtCore.Qt.MatchFlags(QtCore.Qt.MatchRecursive)
-        query = self.match(self.index(0,0), QtCore.Qt.DisplayRole, key, 1, flag)
-        if query: index = query[0]
-        self.rootIndex.emit(index)
+        self.rootIndex.emit(self.indexKey.get(key, QtCore.QModelIndex()))
 
     def flags(self, index=QtCore.QModelIndex()):
         if index.column() == self._header.index("Value") and\
@@ -384,31 +439,31 @@ class PoolModel(PoolBaseModel):
     def report(self, report):
         for key, value in report.items():
             if key == "line":
-                self.nline.emit(str(value))
-            if key == "qr":
-                self.buffers.emit(str(value))
+                self.nline.emit("{}".format(value))
             if key == "posx":
-                self.posx.emit(str(value))
-                self.lastposition[0] = value
+                self.posx.emit("{}".format(value))
             if key == "posy":
-                self.posy.emit(str(value))
-                self.lastposition[1] = value
+                self.posy.emit("{}".format(value))
             if key == "posz":
-                self.posz.emit(str(value))
-                self.lastposition[2] = value
+                self.posz.emit("{}".format(value))
             if key == "vel":
-                self.vel.emit(str(value))
+                self.vel.emit("{}".format(value))
             if key == "feed":
-                self.feed.emit(str(value))
-            #if key == "stat":
-            #    self.stat.emit("{}".format(value))
-        self.positions.append(list(self.lastposition))
+                self.feed.emit("{}".format(value))
+            if key == "stat" and 0 <= value < len(TinyG2Status.STATES):
+                self.stat.emit(TinyG2Status.STATES[value])
+        # Positions are stored by the reader thread, only notify the view
         if not self.obj.ViewObject.Draw:
             return
-        if len(self.positions) < self.obj.ViewObject.Buffers:
+        positions = self.obj.Proxy.Machine.positions
+        if positions.generation != self.generation:
+            # Store cleared by a new job
+            self.generation = positions.generation
+            self.flushed = 0
+        if len(positions) - self.flushed < self.obj.ViewObject.Buffers:
             return
-        self.obj.ViewObject.Positions += list(self.positions)
-        self.positions = []
+        self.flushed = len(positions)
+        self.obj.ViewObject.Positions = positions
 
 
 class PoolDelegate(QtGui.QStyledItemDelegate):
@@ -25,11 +25,14 @@
 from __future__ import unicode_literals
 
 from PySide import QtCore, QtGui
-import FreeCADGui
-from App import Script as AppScript
+import FreeCAD, FreeCADGui
+from App import Script as AppScript, TinyG2Profile
 from Gui import UsbPoolPanel, TinyG2Model, Script as GuiScript
 
 
+""" Model signals shown by the upload monitor labels of the same name """
+MONITOR = ("nline", "buffers", "posx", "posy", "posz", "vel", "feed", "stat")
+
 class PoolTaskPanel(UsbPoolPanel.PoolTaskPanel):
 
     def __init__(self, obj):
@@ -71,8 +74,23 @@ class PoolPanel(QtGui.QTabWidget):
         self.tabbar = SettingTabBar(self)
         setting.layout().addWidget(self.tabbar)
         #model.state.connect(tabbar.on_state)
+        self.model = None
+        view = QtGui.QWidget()
+        view.setLayout(QtGui.QVBoxLayout())
         self.tableview = UsbPoolView(self)
-        setting.layout().addWidget(self.tableview)
+        view.layout().addWidget(self.tableview)
+        buttons = QtGui.QHBoxLayout()
+        save = QtGui.QPushButton("Save profile...")
+        save.clicked.connect(self.onSaveProfile)
+        buttons.addWidget(save)
+        apply = QtGui.QPushButton("Apply profile...")
+        apply.clicked.connect(self.onApplyProfile)
+        buttons.addWidget(apply)
+        deviation = QtGui.QPushButton("Deviation")
+        deviation.clicked.connect(self.onDeviation)
+        buttons.addWidget(deviation)
+        view.layout().addLayout(buttons)
+        setting.layout().addWidget(view)
         self.addTab(setting, "Current settings")
         monitor = QtGui.QWidget()
         monitor.setLayout(QtGui.QGridLayout())
@@ -80,52 +98,136 @@ class PoolPanel(QtGui.QTabWidget):
         line = QtGui.QLabel()
         monitor.layout().addWidget(line, 0, 1, 1, 1)
         monitor.layout().addWidget(QtGui.QLabel("/"), 0, 2, 1, 1)
-        nline = QtGui.QLabel()
-        monitor.layout().addWidget(nline, 0, 3, 1, 1)
-        #model.nline.connect(nline.setText)
+        self.nline = QtGui.QLabel()
+        monitor.layout().addWidget(self.nline, 0, 3, 1, 1)
         monitor.layout().addWidget(QtGui.QLabel("GCode:"), 1, 0, 1, 1)
         gcode = QtGui.QLabel()
         monitor.layout().addWidget(gcode, 1, 1, 1, 3)
         monitor.layout().addWidget(QtGui.QLabel("Buffers:"), 2, 0, 1, 1)
-        buffers = QtGui.QLabel()
-        monitor.layout().addWidget(buffers, 2, 1, 1, 3)
-        #model.buffers.connect(buffers.setText)
+        self.buffers = QtGui.QLabel()
+        monitor.layout().addWidget(self.buffers, 2, 1, 1, 3)
         monitor.layout().addWidget(QtGui.QLabel("PosX:"), 3, 0, 1, 1)
-        posx = QtGui.QLabel()
-        monitor.layout().addWidget(posx, 3, 1, 1, 3)
-        #model.posx.connect(posx.setText)
+        self.posx = QtGui.QLabel()
+        monitor.layout().addWidget(self.posx, 3, 1, 1, 3)
         monitor.layout().addWidget(QtGui.QLabel("PosY:"), 4, 0, 1, 1)
-        posy = QtGui.QLabel()
-        monitor.layout().addWidget(posy, 4, 1, 1, 3)
-        #model.posy.connect(posy.setText)
+        self.posy = QtGui.QLabel()
+        monitor.layout().addWidget(self.posy, 4, 1, 1, 3)
         monitor.layout().addWidget(QtGui.QLabel("PosZ:"), 5, 0, 1, 1)
-        posz = QtGui.QLabel()
-        monitor.layout().addWidget(posz, 5, 1, 1, 3)
-        #model.posz.connect(posz.setText)
+        self.posz = QtGui.QLabel()
+        monitor.layout().addWidget(self.posz, 5, 1, 1, 3)
         monitor.layout().addWidget(QtGui.QLabel("Vel:"), 6, 0, 1, 1)
-        vel = QtGui.QLabel()
-        monitor.layout().addWidget(vel, 6, 1, 1, 3)
-        #model.vel.connect(vel.setText)
+        self.vel = QtGui.QLabel()
+        monitor.layout().addWidget(self.vel, 6, 1, 1, 3)
         monitor.layout().addWidget(QtGui.QLabel("Feed:"), 7, 0, 1, 1)
-        feed = QtGui.QLabel()
-        monitor.layout().addWidget(feed, 7, 1, 1, 3)
-        #model.feed.connect(feed.setText)
+        self.feed = QtGui.QLabel()
+        monitor.layout().addWidget(self.feed, 7, 1, 1, 3)
         monitor.layout().addWidget(QtGui.QLabel("Status:"), 8, 0, 1, 1)
-        stat = QtGui.QLabel()
-        monitor.layout().addWidget(stat, 8, 1, 1, 3)
-        #model.stat.connect(stat.setText)
+        self.stat = QtGui.QLabel()
+        monitor.layout().addWidget(self.stat, 8, 1, 1, 3)
+        self.monitor = monitor
         self.addTab(monitor, "Upload monitor")
+        self.currentChanged.connect(self.onMonitor)
 
     def setModel(self, model):
+        if self.model is not None:
+            if self.model is not model:
+                self.setMonitor(False)
+            # Previous model must no longer update the panel
+            self.tabbar.tabIndex.disconnect(self.model.setRootIndex)
+            self.model.title.disconnect(self.onTitle)
+            for name in MONITOR:
+                getattr(self.model, name).disconnect(getattr(self, name).setText)
+        self.model = model
         self.tabbar.tabIndex.connect(model.setRootIndex)
         model.title.connect(self.onTitle)
         model.title.emit("test")
+        for name in MONITOR:
+            getattr(model, name).connect(getattr(self, name).setText)
         self.tableview.setModel(model)
+        self.onMonitor()
+
+    def setMonitor(self, visible):
+        # Status reports are only needed while the monitor is displayed
+        if hasattr(self.model, "status"):
+            self.model.status.setVisible("monitor", visible)
+
+    @QtCore.Slot()
+    def onMonitor(self):
+        self.setMonitor(self.isVisible() and self.currentWidget() is self.monitor)
+
+    def showEvent(self, event):
+        QtGui.QTabWidget.showEvent(self, event)
+        self.onMonitor()
+
+    def hideEvent(self, event):
+        QtGui.QTabWidget.hideEvent(self, event)
+        self.setMonitor(False)
 
     @QtCore.Slot(unicode)
     def onTitle(self, title):
         self.setWindowTitle(title)
 
+    def getModels(self):
+        """ Models of the TinyG2 pools running in the active document """
+        doc = FreeCAD.ActiveDocument
+        if doc is None:
+            return []
+        return [o.ViewObject.Proxy.Model for o in doc.Objects
+                if AppScript.getObjectType(o) == "App::UsbPool" and
+                GuiScript.getObjectViewType(o.ViewObject) == "Gui::UsbTinyG2" and
+                o.Proxy.Machine.isRunning()]
+
+    @QtCore.Slot()
+    def onSaveProfile(self):
+        if not hasattr(self.model, "getProfile"):
+            return
+        path, f = QtGui.QFileDialog.getSaveFileName(self, "Save profile", "",
+                                                    "TinyG2 profile (*.json)")
+        if path:
+            TinyG2Profile.save(path, self.model.getProfile())
+
+    @QtCore.Slot()
+    def onDeviation(self):
+        obj = getattr(self.model, "obj", None)
+        if obj is None:
+            return
+        if obj.ViewObject.Proxy.startDeviation(obj.ViewObject, self.onDeviated) is not None:
+            self.onTitle("Analysing deviation...")
+
+    @QtCore.Slot(object)
+    def onDeviated(self, result):
+        if isinstance(result, Exception):
+            self.onTitle("Deviation not analysed: {}".format(result))
+            return
+        if not result[2]["count"]:
+            self.onTitle("Deviation: no position to analyse")
+            return
+        self.onTitle("Deviation max {max:.4f}, p99 {p99:.4f}".format(**result[2]))
+
+    @QtCore.Slot()
+    def onApplyProfile(self):
+        if not hasattr(self.model, "applyProfile"):
+            return
+        path, f = QtGui.QFileDialog.getOpenFileName(self, "Apply profile", "",
+                                                    "TinyG2 profile (*.json)")
+        if not path:
+            return
+        try:
+            profile = TinyG2Profile.load(path)
+        except (IOError, ValueError) as e:
+            QtGui.QMessageBox.warning(self, "Apply profile", "{}".format(e))
+            return
+        models = [self.model]
+        others = [m for m in self.getModels() if m is not self.model]
+        if others:
+            msg = "Apply also to the {} other running TinyG2 pools?".format(len(others))
+            yes = QtGui.QMessageBox.question(self, "Apply profile", msg,
+                                             QtGui.QMessageBox.Yes | QtGui.QMessageBox.No)
+            if yes == QtGui.QMessageBox.Yes:
+                models.extend(others)
+        for model in models:
+            model.applyProfile(profile)
+
 
 class UsbPoolView(QtGui.QTreeView):
     
@@ -25,9 +25,18 @@
 from __future__ import unicode_literals
 
 import FreeCADGui
+from PySide import QtGui
 from Gui import Script, UsbPoolPanel, UsbPoolModel, PySerialGui
 
 
+def setScrollback(vobj):
+    """ Apply the Scrollback property to the open terminal of the pool """
+    obj = vobj.Object
+    name = "{}-{}".format(obj.Document.Name, obj.Name)
+    for dock in FreeCADGui.getMainWindow().findChildren(QtGui.QDockWidget, name):
+        dock.setScrollback(vobj.Scrollback)
+
+
 class _ViewProviderPool:
 
     def __init__(self, vobj): #mandatory
@@ -35,7 +44,7 @@ class _ViewProviderPool:
         self.Type = "Gui::UsbPool"
         for p in vobj.PropertiesList:
             if vobj.getGroupOfProperty(p) != "Base":
-                if p not in ["DualView"]:
+                if p not in ["DualView", "Scrollback"]:
                     vobj.removeProperty(p)
         if "DualView" not in vobj.PropertiesList:
             vobj.addProperty("App::PropertyBool",
@@ -43,6 +52,12 @@ class _ViewProviderPool:
                              "Terminal",
                              "Enable/disable terminal dualview")
             vobj.DualView = False
+        if "Scrollback" not in vobj.PropertiesList:
+            vobj.addProperty("App::PropertyInteger",
+                             "Scrollback",
+                             "Terminal",
+                             "Maximum number of lines kept in terminal")
+            vobj.Scrollback = 10000
         self.Object = vobj.Object
         vobj.Proxy = self
 
@@ -71,7 +86,8 @@ class _ViewProviderPool:
         return mode
 
     def onChanged(self, vobj, prop): #optional
-        pass
+        if prop == "Scrollback":
+            setScrollback(vobj)
 
     def updateData(self, obj, prop): #optional
         # this is executed when a property of the APP OBJECT changes
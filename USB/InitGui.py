@@ -57,13 +57,14 @@ class UsbWorkbench(Workbench):
     def Initialize(self):
         from PySide import QtCore
         from Gui import Script
-        from App import DocumentObserver, UsbPool, UsbCommand, TinyG2
+        from App import DocumentObserver, UsbPool, UsbCommand, TinyG2, UsbHotplug
         Script.initIcons()
         commands = [b"Usb_Pool", b"Usb_Refresh", b"Usb_Open", b"Usb_Start", b"Usb_Pause"]
         # Add commands to menu and toolbar
         self.appendToolbar("Commands for Usb", commands)
         self.appendMenu([b"USB"], commands)
         App.addDocumentObserver(DocumentObserver.DocumentObserver())
+        UsbHotplug.Monitor.start()
         Log('Loading USB workbench... done\n')
 
     def GetClassName(self):
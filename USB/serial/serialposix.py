@@ -307,10 +307,17 @@ class Serial(SerialBase, PlatformSpecific):
             raise
         else:
             self.is_open = True
-        if not self._dsrdtr:
-            self._update_dtr_state()
-        if not self._rtscts:
-            self._update_rts_state()
+        try:
+            if not self._dsrdtr:
+                self._update_dtr_state()
+            if not self._rtscts:
+                self._update_rts_state()
+        except IOError as e:
+            if e.errno in (errno.EINVAL, errno.ENOTTY):
+                # ignore Invalid argument and Inappropriate ioctl (e.g. pty)
+                pass
+            else:
+                raise
         self.reset_input_buffer()
 
     def _reconfigure_port(self, force_update=False):
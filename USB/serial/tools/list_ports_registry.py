@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#
+# This is a module that keeps a process wide, change driven cache of the
+# ports returned by list_ports.comports().
+#
+# This file is part of pySerial. https://github.com/pyserial/pyserial
+# (C) 2015 Chris Liechti <cliechti@gmx.net>
+#
+# SPDX-License-Identifier:    BSD-3-Clause
+"""\
+Enumerating the ports is expensive on some platforms (on Linux every device
+found in /dev needs several sysfs files to be read). This module enumerates
+once and shares the result with all its users until the device directory is
+modified, which is detected by polling the directory modification time.
+
+On platforms without such a directory the cache is never considered valid and
+every call falls back to a fresh enumeration.
+"""
+
+import os
+import re
+import threading
+
+from serial.tools import list_ports
+
+
+class PortRegistry(object):
+    """Cached port enumeration, invalidated on device directory changes"""
+
+    def __init__(self, path='/dev'):
+        self.path = path
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._ports = []
+        self._stamp = None
+
+    def stamp(self):
+        """\
+        Return a value that changes whenever an entry is added to or removed
+        from the device directory, None if it can not be watched.
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime)
+
+    def invalidate(self):
+        """Force a new enumeration on next access"""
+        with self._lock:
+            self._stamp = None
+
+    def comports(self):
+        """Return the list of ports, enumerating only if something changed"""
+        stamp = self.stamp()
+        with self._lock:
+            if stamp is None or stamp != self._stamp:
+                ports = sorted(list_ports.comports())
+                if [p.device for p in ports] != [p.device for p in self._ports]:
+                    self.generation += 1
+                self._ports = ports
+                self._stamp = stamp
+            return list(self._ports)
+
+    def grep(self, regexp):
+        """\
+        Search for ports using a regular expression. Same as list_ports.grep()
+        but working on the cached enumeration.
+        """
+        r = re.compile(regexp, re.I)
+        for info in self.comports():
+            port, desc, hwid = info
+            if r.search(port) or r.search(desc) or r.search(hwid):
+                yield info
+
+
+def usb_id(info):
+    """\
+    Return an identifier of the USB device and interface behind a port, that
+    survives a replug on another bus location. None for non USB ports.
+    """
+    if info.vid is None:
+        return None
+    interface = re.findall(r':(\d+\.\d+)', getattr(info, 'device_path', None) or '')
+    return (info.vid, info.pid, info.serial_number, interface[-1] if interface else None)
+
+
+# the registry shared by the whole process
+registry = PortRegistry()
+
+
+def comports():
+    return registry.comports()
+
+
+def grep(regexp):
+    return registry.grep(regexp)
+
+
+def invalidate():
+    registry.invalidate()
+
+
+def find(device):
+    """Return the port info of a device path, None if not present"""
+    for info in registry.comports():
+        if info.device == device:
+            return info
+    return None
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# test
+if __name__ == '__main__':
+    for port, desc, hwid in comports():
+        print("%s: %s [%s]" % (port, desc, hwid))
@@ -21,7 +21,7 @@
 # skip_busy tries to open port to check if it is busy, fails on posix as ports are not locked!
 
 import serial
-import serial.tools.list_ports
+import serial.tools.list_ports_registry
 
 try:
     basestring
@@ -65,7 +65,7 @@ class Serial(serial.Serial):
             else:
                 raise ValueError('unknown option: %r' % (option,))
         # use a for loop to get the 1st element from the generator
-        for port, desc, hwid in sorted(serial.tools.list_ports.grep(regexp)):
+        for port, desc, hwid in serial.tools.list_ports_registry.grep(regexp):
             if test_open:
                 try:
                     s = serial.Serial(port)
@@ -0,0 +1,614 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""\
+End to end benchmark of the workbench: a TinyG2 pool (PoolMachine,
+SerialState, SerialReader and TinyG2Model.PoolModel) driven without the
+FreeCAD GUI against an emulated controller.
+
+FreeCAD is replaced by a stub module and the document objects by minimal
+fakes, only PySide is needed (Python 2, same as the workbench). The
+controller is emulated on the master side of a pseudo-terminal: it answers
+the JSON queries sent at startup, the $$ text dump, and acknowledges G-code
+lines while sending status ({"sr":...}) and queue ({"qr":...}) reports.
+
+Measures:
+
+    startup     time from ctrlStart to a fully populated dataKey
+    restart     time from ctrlStart to the configuration snapshot checked,
+                on a second connection
+    streaming   lines/s for each example .ncc file, streamed with a
+                window of planner buffers like an uploader would do
+    gui         lines/s delivered to the GUI thread (serialRead slots),
+                the model itself only receives the decoded serialData
+    queue       lines read by SerialReader but not yet delivered to the
+                GUI thread, i.e. depth of the Qt event queue in lines
+
+usage: python benchmarks/bench_pool.py [--file NCC]... [--output FILE]
+"""
+
+from __future__ import print_function
+
+import argparse
+import glob
+import json
+import os
+import platform
+import re
+import select
+import sys
+import tempfile
+import threading
+import time
+import types
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'USB'))
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# FreeCAD stub
+
+class Console(object):
+    verbose = False
+
+    def PrintMessage(self, msg):
+        if self.verbose:
+            sys.stderr.write(msg)
+
+    PrintLog = PrintMessage
+
+    def PrintWarning(self, msg):
+        sys.stderr.write(msg)
+
+    PrintError = PrintWarning
+
+
+def install_freecad_stub():
+    userdir = tempfile.mkdtemp(prefix='bench_pool_')
+    freecad = types.ModuleType(str('FreeCAD'))
+    freecad.Console = Console()
+    freecad.GuiUp = False
+    freecad.getUserAppDataDir = lambda: userdir + os.sep
+    freecad.listDocuments = lambda: {}
+    sys.modules['FreeCAD'] = freecad
+    return freecad
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# document objects
+
+DEFAULTS = {
+    'App::PropertyBool': False,
+    'App::PropertyInteger': 0,
+    'App::PropertyIntegerConstraint': 0,
+    'App::PropertyFloat': 0.0,
+    'App::PropertyString': '',
+    'App::PropertyFile': '',
+    'App::PropertyStringList': [],
+    'App::PropertyLinkList': [],
+    'App::PropertyEnumeration': None,
+    'App::PythonObject': None,
+    }
+
+
+class FakeObject(object):
+    """Just enough of a FeaturePython object for the App proxies"""
+
+    def __init__(self, doc, typ, name):
+        d = self.__dict__
+        d['Document'] = doc
+        d['TypeId'] = typ
+        d['Name'] = name
+        d['Label'] = name
+        d['Proxy'] = None
+        d['ViewObject'] = None
+        d['_props'] = {}
+        d['_enums'] = {}
+        d['_modes'] = {}
+        d['_types'] = {}
+
+    @property
+    def PropertiesList(self):
+        return ['Label', 'Proxy'] + list(self._props)
+
+    @property
+    def InList(self):
+        return [o for o in self.Document.Objects
+                if self in o._props.get('Serials', (None, []))[1]]
+
+    def addProperty(self, typ, name, group='', doc='', attr=0):
+        self._props[name] = (group, DEFAULTS.get(typ))
+        self._types[name] = typ
+        if typ == 'App::PropertyEnumeration':
+            self._enums[name] = []
+        self._modes[name] = ['ReadOnly'] if attr & 1 else []
+
+    def removeProperty(self, name):
+        self._props.pop(name, None)
+        self._enums.pop(name, None)
+
+    def getTypeIdOfProperty(self, name):
+        return self._types.get(name, '')
+
+    def getGroupOfProperty(self, name):
+        return self._props[name][0] if name in self._props else ''
+
+    def getEditorMode(self, name):
+        return self._modes.get(name, [])
+
+    def setEditorMode(self, name, mode):
+        self._modes[name] = ['ReadOnly'] if mode == 1 else []
+
+    def touch(self):
+        pass
+
+    def purgeTouched(self):
+        pass
+
+    def __getattr__(self, name):
+        props = self.__dict__['_props']
+        if name in props:
+            return props[name][1]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name not in self._props:
+            self.__dict__[name] = value
+            return
+        if name in self._enums:
+            if isinstance(value, (list, tuple)) or hasattr(value, '__next__'):
+                self._enums[name] = [str(v) for v in value]
+                value = self._enums[name][0] if self._enums[name] else None
+            elif isinstance(value, int):
+                value = self._enums[name][value]
+        elif isinstance(value, tuple):
+            # PropertyIntegerConstraint: (value, min, max, step)
+            value = value[0]
+        self._props[name] = (self._props[name][0], value)
+        proxy = self.__dict__.get('Proxy')
+        if proxy is not None and hasattr(proxy, 'onChanged'):
+            proxy.onChanged(self, name)
+
+
+class FakeDocument(object):
+
+    def __init__(self, name='Bench'):
+        self.Name = name
+        self.Objects = []
+
+    def addObject(self, typ, name):
+        names = set(o.Name for o in self.Objects)
+        label, i = name, 1
+        while label in names:
+            label = '{}{:03d}'.format(name, i)
+            i += 1
+        obj = FakeObject(self, typ, label)
+        self.Objects.append(obj)
+        return obj
+
+    def recompute(self):
+        for obj in list(self.Objects):
+            if obj.Proxy is not None and hasattr(obj.Proxy, 'execute'):
+                obj.Proxy.execute(obj)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# TinyG2 emulator
+
+# groups answered by the emulator that are not part of the configuration
+VIRTUAL = {
+    'o': ('g54', 'g55', 'g56', 'g57', 'g58', 'g59', 'g92', 'g28', 'g30'),
+    'q': ('x', 'y', 'z', 'a', 'b', 'c'),
+    'm': ('1', '2', '3', '4', '5', '6'),
+    }
+
+WORD = re.compile(r'([XYZ])\s*(-?\d*\.?\d+)', re.I)
+
+# relaxed JSON of the firmware: {"sys":n} stands for {"sys":null}
+NULL = re.compile(r':\s*n\s*(?=[,}])')
+
+
+class TinyG2Emulator(object):
+    """TinyG2 speaking JSON on the master side of a pseudo-terminal"""
+
+    def __init__(self, dickey, buffers=28, rate=0, si=0.25):
+        self.master, self.slave = os.openpty()
+        self.device = os.ttyname(self.slave)
+        self.buffers = buffers
+        """ G-code lines executed per second, 0: instant """
+        self.rate = rate
+        """ Status report interval (s) """
+        self.si = si
+        self.config = self.makeConfig(dickey)
+        self.flat = self.makeFlat()
+        """ Lines received but not parsed while the planner is full """
+        self.queue = []
+        self.planner = 0
+        self.position = {'posx': 0.0, 'posy': 0.0, 'posz': 0.0}
+        self.line = 0
+        self.last = time.time()
+        self.lastsr = 0
+        self.alive = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def makeConfig(self, dickey):
+        config = {}
+        for group, value in dickey.items():
+            if isinstance(value, dict):
+                config[group] = dict((k, 1.0) for k in value)
+            else:
+                config[group] = 1
+        config['sys'].update({'fb': 83.09, 'fv': 0.98, 'hp': 3, 'hv': 0,
+                              'id': '0084-bench', 'si': int(self.si * 1000)})
+        return config
+
+    def makeFlat(self):
+        # flat key -> (group, key) for the single key queries like {"xvm":n}
+        flat = {}
+        for group, value in self.config.items():
+            if isinstance(value, dict):
+                for k in value:
+                    flat[('' if group == 'sys' else group) + k] = (group, k)
+        return flat
+
+    def getLeaves(self):
+        # Flat keys as dumped by $$: sys keys alone, others prefixed by group
+        for group, value in sorted(self.config.items()):
+            if isinstance(value, dict):
+                for k, v in sorted(value.items()):
+                    yield ('' if group == 'sys' else group) + k, v
+            else:
+                yield group, value
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.alive = False
+        self.thread.join(2)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def write(self, text):
+        data = (text + '\n').encode('utf-8')
+        while data:
+            n = os.write(self.master, data)
+            data = data[n:]
+
+    def send(self, data):
+        self.write(json.dumps(data, separators=(',', ':')))
+
+    def respond(self, response, status, length):
+        # Footer after the response like the firmware, acks are matched on '{"r":'
+        self.write('{{"r":{},"f":[1,{},{}]}}'.format(
+            json.dumps(response, separators=(',', ':')), status, length))
+
+    def run(self):
+        pending = b''
+        while self.alive:
+            timeout = 0.005 if self.queue or self.planner else 0.1
+            ready, _, _ = select.select([self.master], [], [], timeout)
+            if ready:
+                try:
+                    pending += os.read(self.master, 4096)
+                except OSError:
+                    break
+                lines = re.split(b'[\r\n]', pending)
+                pending = lines.pop()
+                for line in lines:
+                    line = line.strip()
+                    if line:
+                        self.onLine(line.decode('utf-8'))
+            self.execute()
+
+    def onLine(self, line):
+        if line == '$$':
+            for key, value in self.getLeaves():
+                self.write('[{}] {} setting{}{} unit'.format(key, key, ' ' * 8, value))
+        elif line.startswith('{'):
+            self.onJson(line)
+        else:
+            self.queue.append(line)
+
+    def onJson(self, line):
+        try:
+            request = json.loads(NULL.sub(':null', line))
+        except ValueError:
+            self.respond({}, 108, len(line))
+            return
+        response = {}
+        status = 0
+        for key, value in request.items():
+            if key in VIRTUAL:
+                for group in VIRTUAL[key]:
+                    response[group] = dict(self.config[group])
+            elif key in self.config:
+                if isinstance(value, dict):
+                    self.config[key].update(value)
+                elif value not in (None, '', 'n'):
+                    self.config[key] = value
+                current = self.config[key]
+                response[key] = dict(current) if isinstance(current, dict) else current
+            elif key in self.flat:
+                group, k = self.flat[key]
+                if value not in (None, '', 'n'):
+                    self.config[group][k] = value
+                response[key] = self.config[group][k]
+            else:
+                status = 100
+        self.respond(response, status, len(line))
+
+    def execute(self):
+        now = time.time()
+        # Planner drained at rate, lines are acknowledged when they enter it
+        if not self.rate:
+            self.planner = 0
+        elif self.planner:
+            done = min(self.planner, int((now - self.last) * self.rate))
+            if done:
+                self.planner -= done
+                self.last = now
+        else:
+            self.last = now
+        changed = False
+        while self.queue and self.planner < self.buffers:
+            line = self.queue.pop(0)
+            self.line += 1
+            for axis, value in WORD.findall(line):
+                self.position['pos' + axis.lower()] = float(value)
+            self.respond({}, 0, len(line))
+            self.planner += bool(self.rate)
+            changed = True
+        if changed:
+            self.send({'qr': self.buffers - self.planner})
+        if now - self.lastsr >= self.si:
+            self.lastsr = now
+            report = dict(self.position)
+            report.update({'line': self.line, 'vel': 300.0, 'stat': 5 if self.planner else 3})
+            self.send({'sr': report})
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# harness
+
+COMMENT = re.compile(r'\(.*?\)')
+
+PLUGIN = ('TinyG2', {'id': 'bench', 'msg': 'emulator'})
+
+
+def read_gcode(path):
+    lines = []
+    with open(path) as f:
+        for line in f:
+            line = COMMENT.sub('', line).strip()
+            if line:
+                lines.append(line)
+    return lines
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def get_leaves(node):
+    if not node.child:
+        return [node.key]
+    return [k for child in node.child for k in get_leaves(child)]
+
+
+class Bench(object):
+
+    def __init__(self, QtCore, app, obj, model):
+        self.QtCore = QtCore
+        self.app = app
+        self.obj = obj
+        self.model = model
+        self.machine = obj.Proxy.Machine
+        self.stats = obj.Serials[0].Proxy.Stats
+        self.leaves = get_leaves(model.treeKey)
+        self.delivered = 0
+        self.offset = 0
+        self.started = None
+        self.populated = None
+        self.verified = None
+        self.streaming = False
+        self.lines = []
+        self.window = 0
+        self.inflight = 0
+        self.acks = 0
+        self.depths = []
+        self.sampling = False
+        # Connected after the model: the model has seen the line when we do
+        self.machine.ctrlStart.connect(self.onCtrlStart)
+        self.machine.serialRead.connect(self.onSerialRead)
+        self.machine.serialData.connect(self.onSerialData)
+
+    def onCtrlStart(self):
+        self.started = time.time()
+
+    def onSerialData(self, updates):
+        if self.populated is None and self.started is not None and self.isPopulated():
+            self.populated = time.time()
+
+    def onSerialRead(self, line):
+        self.delivered += 1
+        if self.streaming and line.startswith('{"r":'):
+            self.inflight -= 1
+            self.acks += 1
+            self.send()
+
+    def isPopulated(self):
+        value = self.model._header.index('Value')
+        description = self.model._header.index('Description')
+        for key in self.leaves:
+            data = self.model.dataKey[key]
+            if data[value] is None or data[description] is None:
+                return False
+        return True
+
+    def sample(self):
+        # Lines read by SerialReader not yet seen by the GUI thread
+        while self.sampling:
+            self.depths.append(max(0, self.stats.RxLines - self.delivered - self.offset))
+            time.sleep(0.005)
+
+    def wait(self, predicate, timeout):
+        end = time.time() + timeout
+        timer = self.QtCore.QTimer()
+        timer.start(10)
+        while not predicate() and time.time() < end:
+            self.app.processEvents(self.QtCore.QEventLoop.WaitForMoreEvents)
+        timer.stop()
+        return predicate()
+
+    def startup(self, timeout):
+        self.machine.start(self.obj)
+        ok = self.wait(lambda: self.populated is not None, timeout)
+        return {
+            'complete': ok,
+            'ctrl_start_to_populated_s': self.populated - self.started if ok else None,
+            'leaves': len(self.leaves),
+            }
+
+    def restart(self, timeout):
+        """ Reconnect with the configuration snapshot saved on stop """
+        self.stop(timeout)
+        self.started = None
+        self.verified = None
+        self.machine.Serials[0].plugin = PLUGIN
+        self.model.title.connect(self.onTitle)
+        self.machine.start(self.obj)
+        ok = self.wait(lambda: self.verified is not None, timeout)
+        self.model.title.disconnect(self.onTitle)
+        return {
+            'complete': ok,
+            'ctrl_start_to_verified_s': self.verified - self.started if ok else None,
+            }
+
+    def onTitle(self, title):
+        if title == 'Configuration loaded from cache':
+            self.verified = time.time()
+
+    def send(self):
+        while self.lines and self.inflight < self.window:
+            self.machine.serialWrite(self.lines.pop(0))
+            self.inflight += 1
+
+    def stream(self, path, window, timeout):
+        self.lines = read_gcode(path)
+        total = len(self.lines)
+        self.window = window
+        self.inflight = 0
+        self.acks = 0
+        self.depths = []
+        # Lines still pending from the previous phase are not counted
+        self.offset = self.stats.RxLines - self.delivered
+        delivered = self.delivered
+        # Like the upload start: positions restart with the file
+        self.machine.startJob()
+        self.sampling = True
+        sampler = threading.Thread(target=self.sample)
+        sampler.daemon = True
+        sampler.start()
+        start = time.time()
+        self.streaming = True
+        self.send()
+        ok = self.wait(lambda: self.acks >= total, timeout)
+        elapsed = time.time() - start
+        self.streaming = False
+        self.sampling = False
+        sampler.join()
+        gui = self.delivered - delivered
+        return {
+            'file': os.path.basename(path),
+            'lines': total,
+            'acknowledged': self.acks,
+            'complete': ok,
+            'seconds': elapsed,
+            'lines_per_s': self.acks / elapsed if elapsed else None,
+            'gui_lines': gui,
+            'gui_lines_per_s': gui / elapsed if elapsed else None,
+            'queue_depth_mean': sum(self.depths) / float(len(self.depths)) if self.depths else None,
+            'queue_depth_p99': percentile(self.depths, 99),
+            'queue_depth_max': max(self.depths) if self.depths else None,
+            }
+
+    def stop(self, timeout):
+        self.machine.stop()
+        return self.wait(lambda: not self.machine.isRunning(), timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless pool benchmark')
+    parser.add_argument('--file', action='append',
+                        help='.ncc file to stream, may be repeated (default: Examples/*.ncc)')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='emulated G-code lines executed per second, 0 for instant (default: %(default)s)')
+    parser.add_argument('--si', type=float, default=0.25,
+                        help='emulated status report interval in s (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=120,
+                        help='timeout of each phase in s (default: %(default)s)')
+    parser.add_argument('--verbose', action='store_true', help='print FreeCAD console log')
+    parser.add_argument('--output', help='write JSON to this file instead of stdout')
+    args = parser.parse_args()
+
+    install_freecad_stub().Console.verbose = args.verbose
+    from PySide import QtCore
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    from App import UsbPool, TinyG2
+    from Gui import TinyG2Model
+
+    emulator = TinyG2Emulator(TinyG2Model.PoolBaseModel().dickey['r'],
+                              rate=args.rate, si=args.si).start()
+    doc = FakeDocument()
+    obj = doc.addObject('App::DocumentObjectGroupPython', 'Pool')
+    UsbPool.Pool(obj)
+    TinyG2.Pool(obj)
+    obj.DualPort = False
+    obj.Proxy.execute(obj)
+    obj.Serials[0].Port = emulator.device
+    obj.Serials[0].Timeout = 0.05
+    # Signature handshake is out of scope: the plugin is known like on a reuse
+    obj.Proxy.Machine.Serials[0].plugin = PLUGIN
+    model = TinyG2Model.PoolModel(obj)
+
+    bench = Bench(QtCore, app, obj, model)
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.time(),
+        'parameters': {'rate': args.rate, 'si': args.si,
+                       'window': emulator.buffers - obj.Buffers},
+        }
+    try:
+        sys.stderr.write('startup...\n')
+        results['startup'] = bench.startup(args.timeout)
+        sys.stderr.write('restart...\n')
+        results['restart'] = bench.restart(args.timeout)
+        files = args.file or sorted(glob.glob(os.path.join(ROOT, 'USB', 'Examples', '*.ncc')))
+        results['streaming'] = []
+        for path in files:
+            sys.stderr.write('streaming {}...\n'.format(os.path.basename(path)))
+            results['streaming'].append(bench.stream(path, results['parameters']['window'],
+                                                     args.timeout))
+        results['stats'] = dict((p, getattr(bench.stats, p))
+                                for p, doc in bench.stats.getCounters())
+        results['stats']['Latency'] = bench.stats.getLatency()
+    finally:
+        bench.stop(5)
+        emulator.stop()
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
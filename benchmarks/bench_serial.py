@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""\
+Benchmark of the serial package vendored in USB/serial.
+
+Every backend is driven against a local echo peer, so it runs on a plain
+Linux box without any hardware:
+
+    loop://                 software loop back
+    socket://               TCP echo server on localhost
+    rfc2217://              RFC 2217 server on localhost, backed by loop://
+    serialposix.Serial      pseudo-terminal pair, echo on the master side
+    PosixPollSerial         idem
+    VTIMESerial             idem
+
+For each backend it measures the bulk throughput, the round trip latency of
+small messages, the read_until() line rate and the process CPU time per MB
+echoed. Results are written as JSON (stdout or --output).
+
+usage: python benchmarks/bench_serial.py [--size BYTES] [--backend NAME]...
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import resource
+import select
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'USB'))
+
+import serial
+import serial.rfc2217
+import serial.serialposix
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# echo peers
+
+class EchoPeer(object):
+    """Base class of the background echo peers"""
+
+    def __init__(self):
+        self.alive = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.alive = False
+        self.thread.join(2)
+
+    def run(self):
+        raise NotImplementedError
+
+
+class TcpEchoServer(EchoPeer):
+    """Accept one connection and echo everything received"""
+
+    def __init__(self):
+        super(TcpEchoServer, self).__init__()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+
+    def url(self):
+        return 'socket://127.0.0.1:{}'.format(self.port)
+
+    def run(self):
+        client, _ = self.server.accept()
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client.settimeout(0.1)
+        try:
+            while self.alive:
+                try:
+                    data = client.recv(65536)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                client.sendall(data)
+        finally:
+            client.close()
+            self.server.close()
+
+
+class Rfc2217EchoServer(TcpEchoServer):
+    """RFC 2217 server redirecting to a loop:// port, hence echoing"""
+
+    def url(self):
+        return 'rfc2217://127.0.0.1:{}'.format(self.port)
+
+    def run(self):
+        client, _ = self.server.accept()
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client.settimeout(0.1)
+        port = serial.serial_for_url('loop://', timeout=0.05)
+        lock = threading.Lock()
+
+        class Connection(object):
+            def write(self, data):
+                with lock:
+                    client.sendall(data)
+
+        manager = serial.rfc2217.PortManager(port, Connection())
+
+        def port_to_client():
+            while self.alive:
+                data = port.read(port.in_waiting or 1)
+                if data:
+                    Connection().write(b''.join(manager.escape(data)))
+
+        reader = threading.Thread(target=port_to_client)
+        reader.daemon = True
+        reader.start()
+        try:
+            while self.alive:
+                try:
+                    data = client.recv(65536)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                port.write(b''.join(manager.filter(data)))
+        finally:
+            self.alive = False
+            reader.join(1)
+            port.close()
+            client.close()
+            self.server.close()
+
+
+class PtyEcho(EchoPeer):
+    """Pseudo-terminal pair, everything written to the slave is echoed"""
+
+    def __init__(self):
+        super(PtyEcho, self).__init__()
+        self.master, self.slave = os.openpty()
+        self.device = os.ttyname(self.slave)
+
+    def run(self):
+        while self.alive:
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if ready:
+                try:
+                    data = os.read(self.master, 65536)
+                except OSError:
+                    break
+                while data:
+                    n = os.write(self.master, data)
+                    data = data[n:]
+
+    def stop(self):
+        super(PtyEcho, self).stop()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# backends: return (port, peer)
+
+def open_loop():
+    return serial.serial_for_url('loop://', timeout=1), None
+
+
+def open_socket():
+    peer = TcpEchoServer().start()
+    return serial.serial_for_url(peer.url(), timeout=1), peer
+
+
+def open_rfc2217():
+    peer = Rfc2217EchoServer().start()
+    return serial.serial_for_url(peer.url(), timeout=1), peer
+
+
+def open_pty(cls):
+    def opener():
+        peer = PtyEcho().start()
+        return cls(peer.device, baudrate=115200, timeout=1), peer
+    return opener
+
+
+BACKENDS = [
+    ('loop', open_loop),
+    ('socket', open_socket),
+    ('rfc2217', open_rfc2217),
+    ('posix', open_pty(serial.serialposix.Serial)),
+    ('posix-poll', open_pty(serial.serialposix.PosixPollSerial)),
+    ('posix-vtime', open_pty(serial.serialposix.VTIMESerial)),
+    ]
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# measures
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def bench_throughput(port, size, chunk=4096):
+    """Write size bytes while a thread reads back the echo"""
+    block = (b'0123456789abcdef' * (chunk // 16 + 1))[:chunk]
+    size -= size % chunk
+    received = [0]
+
+    def reader():
+        while received[0] < size:
+            data = port.read(min(chunk, size - received[0]))
+            if not data:
+                break
+            received[0] += len(data)
+
+    thread = threading.Thread(target=reader)
+    thread.daemon = True
+    cpu = cpu_time()
+    start = time.time()
+    thread.start()
+    for _ in range(size // chunk):
+        port.write(block)
+    thread.join()
+    elapsed = time.time() - start
+    cpu = cpu_time() - cpu
+    mb = received[0] / 1e6
+    return {
+        'bytes': received[0],
+        'seconds': elapsed,
+        'mb_per_s': mb / elapsed if elapsed else None,
+        'cpu_s_per_mb': cpu / mb if mb else None,
+        'complete': received[0] == size,
+        }
+
+
+def bench_latency(port, count, size=16):
+    """Round trip of small newline terminated messages"""
+    message = b'x' * (size - 1) + b'\n'
+    samples = []
+    for _ in range(count):
+        start = time.time()
+        port.write(message)
+        if port.read_until(b'\n') != message:
+            break
+        samples.append((time.time() - start) * 1e6)
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'mean_us': sum(samples) / len(samples),
+        'p50_us': percentile(samples, 50),
+        'p99_us': percentile(samples, 99),
+        'max_us': max(samples),
+        }
+
+
+def bench_lines(port, count):
+    """read_until() rate on a stream of status report like lines"""
+    line = b'{"sr":{"posx":12.9975,"posy":1.714,"posz":0.0,"vel":300.0,"line":1234}}\n'
+
+    def writer():
+        for _ in range(count):
+            port.write(line)
+
+    thread = threading.Thread(target=writer)
+    thread.daemon = True
+    lines = 0
+    start = time.time()
+    thread.start()
+    while lines < count:
+        if port.read_until(b'\n') != line:
+            break
+        lines += 1
+    elapsed = time.time() - start
+    thread.join()
+    return {
+        'lines': lines,
+        'seconds': elapsed,
+        'lines_per_s': lines / elapsed if elapsed else None,
+        }
+
+
+def run_backend(name, opener, args):
+    result = {'backend': name}
+    try:
+        port, peer = opener()
+    except Exception as e:
+        result['error'] = '{}'.format(e)
+        return result
+    try:
+        # give time to the peers (rfc2217 negotiation) to settle
+        time.sleep(0.2)
+        port.reset_input_buffer()
+        result['throughput'] = bench_throughput(port, args.size)
+        result['latency'] = bench_latency(port, args.count)
+        result['lines'] = bench_lines(port, args.lines)
+    except Exception as e:
+        result['error'] = '{}'.format(e)
+    finally:
+        port.close()
+        if peer is not None:
+            peer.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serial stack benchmark')
+    parser.add_argument('--size', type=int, default=1 << 20,
+                        help='bytes echoed for the throughput measure (default: %(default)s)')
+    parser.add_argument('--count', type=int, default=500,
+                        help='round trips for the latency measure (default: %(default)s)')
+    parser.add_argument('--lines', type=int, default=5000,
+                        help='lines for the read_until measure (default: %(default)s)')
+    parser.add_argument('--backend', action='append', choices=[n for n, o in BACKENDS],
+                        help='backend to run, may be repeated (default: all)')
+    parser.add_argument('--output', help='write JSON to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = {
+        'serial_version': serial.VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.time(),
+        'parameters': {'size': args.size, 'count': args.count, 'lines': args.lines},
+        'results': [],
+        }
+    for name, opener in BACKENDS:
+        if args.backend and name not in args.backend:
+            continue
+        sys.stderr.write('running {}...\n'.format(name))
+        results['results'].append(run_backend(name, opener, args))
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()